@@ -1,8 +1,7 @@
 import numpy as np
 
-from Tile import Tile, TileIndex
-from Player import Player
-from Game import Game, Round
+from Tile import Tile, TileIndex, ids_to_mask
+from Tenpai import Tenpai
 
 class DrawAction:
     '''
@@ -11,7 +10,10 @@ class DrawAction:
     '''
     @staticmethod
     def check_tenpai(hand, open, last_draw):
-        pass                
+        '''
+        Returns dict with ID of possible discards and list of ID of waits, see Tenpai.check_tenpai
+        '''
+        return Tenpai.check_tenpai(hand, open, last_draw)
 
     @staticmethod
     def check_riichi(isTenpai, score):
@@ -21,15 +23,17 @@ class DrawAction:
     
     @staticmethod
     def check_furiten(waits, discard):
-        if any(waits) in discard:
-            return True
-        return False
+        '''
+        Checks if any wait is in the discards, both as 34 bit masks or lists of tile IDs
+        '''
+        return ids_to_mask(waits) & ids_to_mask(discard) != 0
     
     @staticmethod
-    def check_tsumo(last_draw, waits):
-        if last_draw in waits:
-            return True
-        return False
+    def check_tsumo(hand, open=None):
+        '''
+        Checks if the hand after drawing is complete, see Tenpai.check_agari
+        '''
+        return Tenpai.check_agari(hand, open)
     
     @staticmethod
     def check_self_kan(hand, open, last_draw):
@@ -75,10 +79,19 @@ class DiscardAction:
     player after a tile has been discarded
     '''
     @staticmethod
-    def check_ron(last_discard, waits):
-        if last_discard in waits:
-            return True
-        return False
+    def check_ron(hand, last_discard, open=None):
+        '''
+        Checks if the hand is complete with the discarded tile
+        '''
+        return bool(Tenpai.check_ron_all(hand[None], last_discard,
+                                         None if open is None else open[None])[0])
+
+    @staticmethod
+    def check_ron_all(hands, last_discard, opens=None):
+        '''
+        Checks for every player at once, see Tenpai.check_ron_all
+        '''
+        return Tenpai.check_ron_all(hands, last_discard, opens)
     
     @staticmethod
     def check_chii(hand, last_discard):
@@ -117,20 +130,20 @@ class DiscardAction:
         possible_chii = []
         canChii = False
         if oneLeft == True and twoLeft == True:
-            possible_chii.append((Tile(id-2, red_LL), Tile(id-1, red_L)))
+            possible_chii.append((Tile.of(id-2, red_LL), Tile.of(id-1, red_L)))
             canChii = True
             if both_LL == True or both_L == True:
-                possible_chii.append((Tile(id-2, False), Tile(id-1, False)))
+                possible_chii.append((Tile.of(id-2, False), Tile.of(id-1, False)))
         if oneLeft == True and oneRight == True:
-            possible_chii.append((Tile(id-1, red_L), Tile(id+1, red_R)))
+            possible_chii.append((Tile.of(id-1, red_L), Tile.of(id+1, red_R)))
             canChii = True
             if both_L == True or both_R == True:
-                possible_chii.append((Tile(id-1, False), Tile(id+1, False)))
+                possible_chii.append((Tile.of(id-1, False), Tile.of(id+1, False)))
         if oneRight == True and twoRight == True:
-            possible_chii.append((Tile(id+1, red_R), Tile(id+2, red_RR)))
+            possible_chii.append((Tile.of(id+1, red_R), Tile.of(id+2, red_RR)))
             canChii = True
             if both_R == True or both_RR == True:
-                possible_chii.append((Tile(id+1, False), Tile(id+2, False)))
+                possible_chii.append((Tile.of(id+1, False), Tile.of(id+2, False)))
 
         return canChii, possible_chii
     
@@ -145,4 +158,56 @@ class DiscardAction:
         canPon = hand[id, 1]
         canKan = hand[id, 2]
         canPonRed = True if canKan is True and hand[id, 4] is True else False
-        return canPon, canPonRed, canKan
\ No newline at end of file
+        return canPon, canPonRed, canKan
+
+    @staticmethod
+    def check_calls(hands, last_discard, seat, opens=None, furiten=None, riichi=None):
+        '''
+        Checks the calls of every player on a discard at once
+        hands: players x 34 x 5 indexes of the closed hands
+        seat: seat of the player who discarded
+        opens: players x 34 x 5 indexes of called tiles, or None if nobody has called
+        furiten, riichi: bool arrays with one value per player, or None for all False
+            Furiten players can't ron, riichi players can only ron
+        Returns dict of masks with one row per player:
+        ron, pon, kan: bool; pon_red: pon can be made with the red tile
+        chii: bool players x 3 x 2; one row per shape (two left, both sides, two right),
+            columns for whether it can be made without or with a red tile
+        best: highest call of each player, ranked as in CALLS
+        order: players with a call, in the order they get to claim the tile
+        '''
+        players = len(hands)
+        id = last_discard.id
+        counts = hands[:, :, :4].sum(axis=2)
+        reds = hands[:, :, 4]
+        others = np.arange(players) != seat
+        furiten = np.zeros(players, dtype=bool) if furiten is None else np.asarray(furiten, dtype=bool)
+        riichi = np.zeros(players, dtype=bool) if riichi is None else np.asarray(riichi, dtype=bool)
+        canCall = others & ~riichi
+
+        ron = Tenpai.check_ron_all(hands, id, opens) & others & ~furiten
+        pon = canCall & (counts[:, id] >= 2)
+        pon_red = pon & reds[:, id]
+        kan = canCall & (counts[:, id] == 3)
+
+        # Chii is only for the next player in 4 player games, shapes must stay inside the suit
+        value = id % 9
+        shapes = np.clip(id + _CHII_OFFSETS, 0, 33)
+        valid = ((id < 27) & (value + _CHII_OFFSETS.min(axis=1) >= 0)
+                 & (value + _CHII_OFFSETS.max(axis=1) <= 8))
+        has = counts[:, shapes] > 0
+        plain = (counts - reds)[:, shapes] > 0
+        red = reds[:, shapes]
+        withRed = (red[:, :, 0] & has[:, :, 1]) | (has[:, :, 0] & red[:, :, 1])
+        chii = np.stack((plain.all(axis=2), withRed), axis=2)
+        isNext = (np.arange(players) == (seat + 1) % players) & (players == 4)
+        chii &= (valid[None, :] & (isNext & canCall)[:, None])[:, :, None]
+
+        best = np.select([ron, kan, pon, chii.any(axis=(1, 2))], [4, 3, 2, 1], 0)
+        order = sorted(np.where(best > 0)[0].tolist(), key=lambda p: (-best[p], (p - seat) % players))
+        return {'ron': ron, 'pon': pon, 'pon_red': pon_red, 'kan': kan, 'chii': chii,
+                'best': best, 'order': order}
+
+# Calls ranked by priority, used for the best mask of DiscardAction.check_calls
+CALLS = ('none', 'chii', 'pon', 'kan', 'ron')
+_CHII_OFFSETS = np.array([[-2, -1], [-1, 1], [1, 2]])
\ No newline at end of file
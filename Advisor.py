@@ -0,0 +1,233 @@
+import time
+from collections import deque
+from multiprocessing import Pool, TimeoutError, cpu_count
+import numpy as np
+
+from Tenpai import Tenpai
+from Yaku import Yaku
+from Dora import DoraIndex
+'''
+Define DiscardAdvisor class, which estimates the win rate and expected score of every discard
+by Monte Carlo rollouts
+- Draws are sampled from the unseen tiles, the full deck minus the player's own hand, every
+  discard and called tile, and the revealed dora indicators, see Round.unseen_counts()
+- After each draw that does not win, the rollout discards the tile that keeps shanten lowest,
+  the drawn tile on a tie. Only tsumo wins are counted
+- Rollouts of every discard are run together as one batch of tile count arrays, batches can be
+  spread over a process pool. With a time budget, batches are sized from the measured rollout
+  rate to fit in the time left, and the evaluation ends at the deadline. Batches still running
+  then keep their process busy, and no batch of a later evaluation is sent to it until they end
+- Dora are counted in the closed hand and in the player's called tiles
+'''
+
+class DiscardAdvisor:
+    '''
+    Evaluates the discards of a player by rollouts of their next draws
+    draws: number of draws each rollout looks ahead
+    samples: number of rollouts per discard
+    batch: most rollouts per discard in one batch, the unit of work of a process
+    budget: float or None; seconds an evaluation may take. Batches still running in worker
+        processes at the deadline are dropped, in this process the last batch started before
+        the deadline is finished, so the budget is overrun by at most one batch. Batches are
+        sized to take half the time left at the measured rate, until it is measured they
+        run CALIBRATION rollouts per discard
+    abandoned: results of dropped batches still running, each holds one process of the pool
+    processes: number of worker processes, 0 runs in this process, None uses all cores
+    seed: int or None; root seed, every batch gets an independent child seed
+    rate: rollouts of one hand per second of one process, measured from finished batches
+    '''
+    def __init__(self, draws=6, samples=1024, batch=256, budget=None, processes=0, seed=None):
+        self.draws = draws
+        self.samples = samples
+        self.batch = batch
+        self.budget = budget
+        self.processes = cpu_count() if processes is None else processes
+        self.seeds = np.random.SeedSequence(seed)
+        self.pool = None
+        self.rate = None
+        self.abandoned = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Shuts down the process pool, if one was started
+        '''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.abandoned.clear()
+
+    def evaluate(self, round, seat, melds=(), indicators=(), dealer=None):
+        '''
+        Estimates the outcome of each possible discard of a player holding 3n + 2 tiles
+        round: Round object, read through its board planes
+        melds: list of (kind, id) tuples of the player's calls, see Yaku.score()
+        indicators: Tiles or IDs of the revealed dora indicators
+        dealer: seat of the dealer, defaults to the one of round.round
+        Returns dict keyed by discard ID, with the win rate within draws, the expected score
+        change of the player and the number of rollouts, which is 0 if the budget ran out
+        before any batch finished
+        '''
+        mode = round.mode
+        dealer = (round.round - 1) % mode if dealer is None else dealer
+        hand = round.board[round.plane('hand', seat)]
+        called = round.board[round.plane('open', seat)]
+        counts = hand[:, :4].sum(axis=1).astype(np.int64)
+        closed = not round.board[round.plane('open', seat), :, 0].any()
+        dora = DoraIndex.from_indicators(list(indicators), mode=mode)
+
+        # One starting hand per discard, a red five is only given up with its last copy
+        discards = np.where(counts > 0)[0]
+        starts = np.repeat(counts[None, :], len(discards), axis=0)
+        starts[np.arange(len(discards)), discards] -= 1
+        reds = hand[:, 4].astype(np.int64)
+        red = reds.sum() - (reds[discards] & (counts[discards] == 1))
+        unseen = round.unseen_counts(seat, indicators)
+
+        meld_dora = int(called[:, :4].sum(axis=1) @ dora.weights()) + int(called[:, 4].sum())
+
+        job = {'starts': starts, 'reds': red, 'meld_dora': meld_dora, 'unseen': unseen,
+               'draws': min(self.draws, int(unseen.sum())), 'closed': closed,
+               'melds': tuple(melds), 'seat': (seat - dealer) % mode, 'wind': round.wind,
+               'weights': dora.weights(), 'mode': mode}
+
+        wins = np.zeros(len(discards), dtype=np.int64)
+        points = np.zeros(len(discards), dtype=np.int64)
+        samples = 0
+        for batch_wins, batch_points, size in self._run(job):
+            wins += batch_wins
+            points += batch_points
+            samples += size
+        runs = max(samples, 1)
+        return {int(id): {'win': float(wins[i] / runs), 'score': float(points[i] / runs),
+                         'samples': samples}
+                for i, id in enumerate(discards)}
+
+    def _jobs(self, job, deadline):
+        '''
+        Yields the batches of an evaluation until the samples or the time run out, each sized
+        to take half the time left before deadline at the measured rate, so the last batches
+        shrink instead of running past it
+        '''
+        left = self.samples
+        while left > 0:
+            size = min(self.batch, left)
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return
+                fit = (CALIBRATION if self.rate is None
+                       else int(self.rate * remaining / 2 / len(job['starts'])))
+                size = min(size, max(fit, 1))
+            left -= size
+            yield dict(job, samples=size, seed=self.seeds.spawn(1)[0])
+
+    def _measured(self, result):
+        '''
+        Updates the rollout rate from a finished batch, returns its wins, points and samples
+        '''
+        wins, points, samples, rows, seconds = result
+        rate = rows / max(seconds, 1e-9)
+        self.rate = rate if self.rate is None else (self.rate + rate) / 2
+        return wins, points, samples
+
+    def _run(self, job):
+        '''
+        Yields the results of the batches of a job until they run out or the budget does,
+        keeping one batch in flight per process not held by an abandoned batch
+        '''
+        deadline = None if self.budget is None else time.perf_counter() + self.budget
+        jobs = self._jobs(job, deadline)
+        if self.processes == 0:
+            for batch in jobs:
+                yield self._measured(_rollouts(batch))
+            return
+
+        if self.pool is None:
+            self.pool = Pool(self.processes)
+        pending = deque()
+        exhausted = False
+        while True:
+            self.abandoned = deque(result for result in self.abandoned if not result.ready())
+            while exhausted is False and len(pending) + len(self.abandoned) < self.processes:
+                batch = next(jobs, None)
+                if batch is None:
+                    exhausted = True
+                else:
+                    pending.append(self.pool.apply_async(_rollouts, (batch, )))
+            timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            if len(pending) == 0:
+                # Every process is busy with batches of an earlier evaluation, wait for one
+                if exhausted is True or len(self.abandoned) == 0:
+                    return
+                self.abandoned[0].wait(timeout)
+                if not self.abandoned[0].ready():
+                    return
+                continue
+            try:
+                result = pending[0].get(timeout)
+            except TimeoutError:
+                # Batches still running are left to finish in the pool and their results dropped
+                self.abandoned.extend(pending)
+                return
+            pending.popleft()
+            yield self._measured(result)
+
+# Rollouts per discard of the first batches, before the rollout rate has been measured
+CALIBRATION = 4
+
+def _rollouts(job):
+    '''
+    Plays samples rollouts from every starting hand of a job
+    Returns the number of wins and the total score change of each starting hand, samples, and
+    the number of rollouts and seconds they took
+    '''
+    start = time.perf_counter()
+    rng = np.random.default_rng(job['seed'])
+    starts, samples, draws, closed = job['starts'], job['samples'], job['draws'], job['closed']
+    n_starts = len(starts)
+    rows = n_starts * samples
+
+    # Draw order of each rollout, a random arrangement of the unseen tiles cut to draws
+    pool = np.repeat(np.arange(34), job['unseen'])
+    drawn = pool[np.argsort(rng.random((rows, len(pool))), axis=1)[:, :draws]]
+    counts = np.repeat(starts, samples, axis=0)
+    origin = np.repeat(np.arange(n_starts), samples)
+    reds = np.repeat(job['reds'], samples)
+
+    wins = np.zeros(n_starts, dtype=np.int64)
+    points = np.zeros(n_starts, dtype=np.int64)
+    active = np.arange(rows)
+    for step in range(draws):
+        tiles = drawn[active, step]
+        counts[active, tiles] += 1
+        agari = Tenpai.check_agari_counts(counts[active], closed)
+        for row, tile in zip(active[agari], tiles[agari]):
+            dora = int(counts[row] @ job['weights']) + int(reds[row]) + job['meld_dora']
+            score = Yaku.score(counts[row], job['melds'], tile, tsumo=True, seat=job['seat'],
+                               round=job['wind'], dora=dora, mode=job['mode'])
+            if score is not None:
+                wins[origin[row]] += 1
+                points[origin[row]] += score.transfer[job['seat']]
+        active, tiles = active[~agari], tiles[~agari]
+        if step == draws - 1 or len(active) == 0:
+            break
+
+        # Keep the hand with the lowest shanten, preferring to discard the drawn tile
+        # A hand holds at most 14 kinds of tiles, so only those are tried
+        hands = counts[active]
+        kinds = np.argsort(hands == 0, axis=1, kind='stable')[:, :14]
+        options = np.repeat(hands[:, None, :], kinds.shape[1], axis=1)
+        np.put_along_axis(options, kinds[:, :, None],
+                          np.take_along_axis(hands, kinds, axis=1)[:, :, None] - 1, axis=2)
+        keys = 2 * Tenpai.shanten_counts(np.maximum(options, 0), closed, closed).astype(np.int64)
+        keys[np.take_along_axis(hands, kinds, axis=1) == 0] = np.iinfo(np.int64).max
+        keys[kinds == tiles[:, None]] -= 1
+        counts[active, kinds[np.arange(len(active)), keys.argmin(axis=1)]] -= 1
+    return wins, points, samples, rows, time.perf_counter() - start
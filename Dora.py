@@ -1,22 +1,76 @@
 import numpy as np
-from Tile import Tile
+from Tile import Tile, TileIndex, counts_to_index
 '''
 Define Dora and DoraIndex classes
+- Dora indicators point to the next tile of their suit, 9 wraps to 1, winds go ESWN and
+  dragons go Haku Hatsu Chun. In 3 player games the 1m indicator points to 9m and back
+- Indicators are turned into a count per tile ID with a 34 x 34 successor matrix, so the
+  dora of a hand (or a batch of hands) is a dot product with its tile counts
 '''
+
+def _successors(mode):
+    '''
+    Returns the 34 entry table of the dora each tile ID indicates
+    '''
+    successor = np.empty(34, dtype=np.int64)
+    for a, b in ((0, 9), (9, 18), (18, 27), (27, 31), (31, 34)):
+        ids = np.arange(a, b)
+        successor[ids] = np.roll(ids, -1)
+    if mode == 3:
+        successor[0] = 8
+        successor[8] = 0
+    return successor
+
+SUCCESSORS = {3: _successors(3), 4: _successors(4)}
+SUCCESSOR_MATRIX = {mode: np.eye(34, dtype=np.int64)[successor]
+                    for mode, successor in SUCCESSORS.items()}
+
+def _indicator_counts(indicators):
+    '''
+    Returns the count of each tile ID among indicators given as a TileIndex, a 34 x 5 index,
+    34 counts or a sequence of Tile objects or IDs
+    '''
+    if isinstance(indicators, TileIndex):
+        indicators = indicators.index
+    indicators = np.asarray(indicators) if not isinstance(indicators, (list, tuple)) else indicators
+    if isinstance(indicators, np.ndarray) and indicators.shape == (34, 5):
+        return indicators[:, :4].sum(axis=1).astype(np.int64)
+    if isinstance(indicators, np.ndarray) and indicators.shape == (34, ):
+        return indicators.astype(np.int64)
+    ids = [tile.id if isinstance(tile, Tile) else int(tile) for tile in indicators]
+    return np.bincount(np.array(ids, dtype=np.int64), minlength=34)
+
 class Dora(Tile):
     '''
     A subclass of Tile that gets dora attributes
+    mode: number of players, 3 player games wrap 1m to 9m
+    dora: ID of the dora tile this tile indicates
     '''
-    pass
+    __slots__ = ('mode', )
+
+    def __init__(self, id, isRed=False, mode=4):
+        super().__init__(id, isRed)
+        object.__setattr__(self, 'mode', mode)
+
+    def __reduce__(self):
+        return (Dora, (self.id, self.isRed, self.mode))
+
+    @property
+    def dora(self):
+        return int(SUCCESSORS[self.mode][self.id])
 
 class DoraIndex:
     '''
     A 34 x 5 numpy array that encodes all the dora tiles, determined from the Dora objects
+    dora, ura: number of times each tile ID counts as dora and ura dora
     '''
-    def __init__(self, index=np.full((34, 5), False, dtype=bool)):
+    def __init__(self, index=None):
         '''
         Initializes an index. Default value is all False
         '''
+        if index is None:
+            index = np.full((34, 5), False, dtype=bool)
+
         # Check if input index matches requirements
         if not isinstance(index, (np.ndarray)):
             raise ValueError('index must be a numpy array')
@@ -27,7 +81,25 @@ class DoraIndex:
         
         # Set instance index as input index
         self.index = index
-    
+        self.dora = index[:, :4].sum(axis=1).astype(np.int64)
+        self.ura = np.zeros(34, dtype=np.int64)
+
+    @classmethod
+    def from_indicators(cls, indicators, ura=None, mode=4):
+        '''
+        Creates a DoraIndex from the revealed dora indicators, and optionally ura dora ones
+        indicators, ura: TileIndex, 34 x 5 index, 34 counts or sequence of Tiles or IDs
+        A TileIndex from Mahjong.shuffle() holds all 5 indicators, pass the revealed Tiles of
+        dora_indicators instead to only count those
+        '''
+        matrix = SUCCESSOR_MATRIX[mode]
+        dora = _indicator_counts(indicators) @ matrix
+        doraindex = cls(counts_to_index(np.minimum(dora, 4)))
+        doraindex.dora = dora
+        if ura is not None:
+            doraindex.ura = _indicator_counts(ura) @ matrix
+        return doraindex
+
     def exist(self, tile):
         '''
         Checks if tile exists in dora index
@@ -48,6 +120,26 @@ class DoraIndex:
 
         return exists
 
-man9 = Tile(8, False)
-man9dora = Dora(man9)
-print(man9dora)
\ No newline at end of file
+    def weights(self, riichi=False):
+        '''
+        Returns the dora value of each tile ID, ura dora only count for riichi hands
+        '''
+        return self.dora + self.ura if riichi is True else self.dora
+
+    def count(self, hand, riichi=False):
+        '''
+        Returns the number of dora, ura dora and red tiles in a hand
+        hand: 34 x 5 index of every tile in the hand, closed and called
+        '''
+        return int(hand[:, :4].sum(axis=1) @ self.weights(riichi)) + int(np.count_nonzero(hand[:, 4]))
+
+    def count_batch(self, hands, riichi=False):
+        '''
+        Vectorized count for N x 34 x 5 hands
+        riichi: bool or bool array with one value per hand
+        Returns int array with one count per hand
+        '''
+        counts = hands[:, :, :4].sum(axis=2)
+        riichi = np.asarray(riichi, dtype=bool)
+        weights = self.dora + riichi[..., None] * self.ura
+        return (counts * weights).sum(axis=-1) + np.count_nonzero(hands[:, :, 4], axis=1)
@@ -1,30 +1,25 @@
 from dataclasses import dataclass, field
-import yaml
 import numpy as np
-import pandas as pd
-import h5py as h5
-from pathlib import Path
 
-from Tile import Tile, TileIndex
-from Player import Player
+from Tile import Tile, TileIndex, index_add, index_remove
+from Player import WaitTracker
+from Logger import GameLogger, allocate_game_ids, load_globals
+from Action import DrawAction, DiscardAction
+from Tenpai import Tenpai
+from Yaku import Yaku
+from Mahjong import shuffle
+from Profiler import PhaseTimer, phase
 
 '''
 Define _GameBase private dataclass, and Game and Round public dataclasses
-- game_ids in globals.yml is a dictionary that stores game type and game ID
-- Games will be logged under its game ID, which will be incremented each time one is logged
-- Game type can be named after the purpose or type of the game (eg. test, sanma) and will be 
-  in the name of the log file before the game ID
+- game_ids in globals.yml is a dictionary that stores game type and the next free game ID
+- Games will be logged under its game ID, which is allocated and saved back to globals.yml 
+  each time one is logged, see Logger.allocate_game_ids()
+- Game type can be named after the purpose or type of the game (eg. test, sanma), all games
+  of a game type are logged to the file '{game_type}.h5' unless a GameLogger is passed in
+- globals.yml is only read once the first logged game is made, see Logger.load_globals()
 '''
 
-# Set script path to current directory
-script_path = Path(__file__, '..').resolve()
-
-# Open globals file and load game id list
-with open(script_path.joinpath('globals.yml'), "r") as globalsfile:
-    globals = yaml.safe_load(globalsfile)
-game_type = globals['game_type']
-game_ids = globals['game_ids']
-
 # Private classes, meant for public classes to inherit
 @dataclass
 class _GameBase:
@@ -61,14 +56,19 @@ class _GameBase:
 class Game(_GameBase):
     '''
     Class object for a game of Mahjong
-    doLogging: whether to log this game, will create a log file if True
+    doLogging: whether to log this game, will create or append to a log file if True
+    log: GameLogger to log to, defaults to the shared logger of the game type, or a
+        Replay.ReplayLogger to log the actions of each round instead of gameboards
+    timer: PhaseTimer to time the deals and log flushes with, and the rounds it deals, None for
+        no timing
     If do logging, game_id and game_type can be edited in globals.yml
     '''
     # Init variables
     doLogging: bool = False
+    log: GameLogger = field(default=None, repr=False)
+    timer: PhaseTimer = field(default=None, repr=False)
 
     # Post-init variables
-    log: h5.File = field(default_factory=lambda: None, init=False, repr=False)
     game_id: int = field(default=0, init=False)
     game_type: str = field(default=None, init=False)
 
@@ -77,27 +77,58 @@ class Game(_GameBase):
         super().__post_init__()
         # If doLogging, set up everything needed for log (game ID, game type, log file)
         if self.doLogging is True:
-            global game_type
-            global game_ids
-            object.__setattr__(self, 'game_type', game_type)
-            if game_type not in game_ids:
-                object.__setattr__(self, 'game_id', 0)
-                game_ids.update({str(self.game_type): 0})
-            else:
-                object.__setattr__(self, 'game_id', game_ids[self.game_type])
-                game_ids[str(self.game_type)] += 1
-            object.__setattr__(self, 'log', h5.File(f'{self.game_type} {self.game_id}', 'w'))
-            self.log.create_dataset('Player names', (self.mode, ), data=self.names)
-            self.log.create_group('East round')
-            ### remember to find way to save game_ids back to globals
+            object.__setattr__(self, 'game_type', load_globals()['game_type'])
+            object.__setattr__(self, 'game_id', allocate_game_ids(self.game_type)[0])
+            if self.log is None:
+                object.__setattr__(self, 'log', GameLogger.shared(f'{self.game_type}.h5'))
+            self.log.start_game(self.game_id, self.mode, self.names)
     
     def update():
         pass
 
+    def log_board(self, gameboard):
+        '''
+        Buffers a gameboard of this game in the log, if logging
+        '''
+        if self.doLogging is True:
+            self.log.log_board(gameboard)
+
+    def start_round(self, seed=None):
+        '''
+        Deals a new round of this game, and starts logging it if logging to a log that records
+        actions
+        seed: int seed or numpy Generator to deal from, see Mahjong.shuffle(). An int seed is
+            stored instead of the starting board, see Replay.ReplayLogger.start_round()
+        Returns the Round, and the wall and dora indicator Tiles in draw order
+        '''
+        with phase(self.timer, 'deal'):
+            hands, hands_index, wall, wall_index, dora_indicators, doras_index, deck = shuffle(self.mode, seed)
+            round = Round(mode=self.mode, names=self.names, hands=hands_index, wall=wall_index,
+                          doras=doras_index, deck=deck, timer=self.timer)
+        if self.doLogging is True and hasattr(self.log, 'start_round'):
+            self.log.start_round(round, seed if isinstance(seed, int) else None)
+        return round, wall, dora_indicators
+
+    def end(self):
+        '''
+        Ends the game, and hands its log to the logger to be written in the next batch
+        '''
+        object.__setattr__(self, 'isOver', True)
+        if self.doLogging is True:
+            self.log.end_game(self.timer)
+
 @dataclass
 class Round(_GameBase):
     '''
     Class object for a round of Mahjong
+    Actions are applied with apply() and taken back with undo(), each applied action is kept
+    in history as the tile moves between board planes it made and the turn state before it
+    tracker keeps every player's waits and furiten up to date as actions are applied
+    recorders: objects told of every applied and undone action, after the board has changed,
+        with recorder.applied(round, action, seat, tile, tiles, source) and
+        recorder.undone(round, action, seat), see Replay.ReplayLogger.start_round()
+    turn: seat of the player that took the last applied action, 0 before any action
+    timer: PhaseTimer to time apply(), check_action() and score() with, None for no timing
     '''
     # Init variables
     players: np.ndarray = field(default_factory=lambda: np.array([]), repr=False)
@@ -105,6 +136,7 @@ class Round(_GameBase):
     wall: TileIndex = field(default_factory=lambda: TileIndex(), repr=False)
     doras: np.ndarray = field(default_factory=lambda: np.array([]), repr=False)
     deck: TileIndex = field(default_factory=lambda: TileIndex(), repr=False)
+    timer: PhaseTimer = field(default=None, repr=False)
 
     # Post-init variables
     opens: np.ndarray = field(default_factory=lambda: None, init=False, repr=False)
@@ -115,6 +147,10 @@ class Round(_GameBase):
     last_draw: Tile = field(default_factory=lambda: None, init=False, repr=False)
     step: bool = field(default=False, init=False, repr=False)
     last_step: bool = field(default=True, init= False, repr=False)
+    board: np.ndarray = field(default_factory=lambda: None, init=False, repr=False)
+    history: list = field(default_factory=list, init=False, repr=False)
+    tracker: WaitTracker = field(default=None, init=False, repr=False)
+    recorders: list = field(default_factory=list, init=False, repr=False)
     gameboard: dict = field(init= False, repr=False)
     
     @property
@@ -125,24 +161,188 @@ class Round(_GameBase):
     def gameboard(self, gameboard):
         '''
         Set gameboard using all the TileIndexes, and make sure they're updated every turn
+        All indexes are bound to planes of one preallocated planes x 34 x 5 board, in order
+        every hand, every open, every discard, wall, dora, ura dora and deck
+        gameboard holds named views of the planes, so neither needs to be copied or restacked
         '''
         gameboard = {}
         if self.names is None:
             object.__setattr__(self, 'names', [f'P{i+1}' for i in range(self.mode)])
-        for i, hand in enumerate(self.hands):
-            gameboard.update({f'{self.names[i]} hand': hand.index})
-        if self.opens is not None:
-            for i, open in enumerate(self.opens):
-                gameboard.update({f'{self.names[i]} open': open.index})
-        if self.discards is not None:
-            for i, open in enumerate(self.discards):
-                gameboard.update({f'{self.names[i]} discard': open.index})
-        gameboard.update({'wall': self.wall.index})
-        gameboard.update({'dora': self.doras[0].index})
-        gameboard.update({'ura dora': self.doras[1].index})
-        gameboard.update({'deck': self.deck.index})
+        for name in ('opens', 'discards'):
+            if getattr(self, name) is None:
+                indexes = np.ndarray((self.mode, ), dtype=TileIndex)
+                indexes[:] = [TileIndex() for _ in range(self.mode)]
+                object.__setattr__(self, name, indexes)
+        board = np.zeros((3 * self.mode + 4, 34, 5), dtype=bool)
+        planes = iter(board)
+        for kind, indexes in (('hand', self.hands), ('open', self.opens), ('discard', self.discards)):
+            for i, index in enumerate(indexes):
+                gameboard.update({f'{self.names[i]} {kind}': index.bind(next(planes))})
+        gameboard.update({'wall': self.wall.bind(next(planes))})
+        gameboard.update({'dora': self.doras[0].bind(next(planes))})
+        gameboard.update({'ura dora': self.doras[1].bind(next(planes))})
+        gameboard.update({'deck': self.deck.bind(next(planes))})
+        object.__setattr__(self, 'board', board)
+        object.__setattr__(self, 'tracker', WaitTracker(list(board[:self.mode]),
+                                                        list(board[self.mode:2 * self.mode])))
         self._gameboard = gameboard
+
+    def plane(self, kind, seat=0):
+        '''
+        Returns the board plane number of an index
+        kind: 'hand', 'open' or 'discard' for a player's seat, or 'wall', 'dora', 'ura dora', 'deck'
+        '''
+        if kind in ('hand', 'open', 'discard'):
+            return ('hand', 'open', 'discard').index(kind) * self.mode + seat
+        return 3 * self.mode + ('wall', 'dora', 'ura dora', 'deck').index(kind)
+
+    def apply(self, action, seat, tile, tiles=(), source=None):
+        '''
+        Applies an action to the board and pushes it onto history
+        action: 'draw', 'discard', 'chii', 'pon', 'kan', 'closed kan' or 'added kan'
+        seat: int; seat of the player taking the action
+        tile: Tile drawn, discarded or called, or the fourth tile of a closed/added kan
+        tiles: Tiles from the hand that make up the call with tile
+        source: seat whose discard is called, defaults to the last player that discarded
+        Raises IndexError and leaves the board unchanged if a tile is not where it should be,
+        ValueError if the action is not valid or there is no discard to call
+        '''
+        with phase(self.timer, action if action in ('draw', 'discard') else 'call'):
+            source = self._apply(action, seat, tile, tiles, source)
+        for recorder in self.recorders:
+            recorder.applied(self, action, seat, tile, tiles, source)
+
+    def _apply(self, action, seat, tile, tiles, source):
+        '''
+        Applies an action, see apply(), returns the seat whose discard was called or None
+        '''
+        hand = self.plane('hand', seat)
+        open = self.plane('open', seat)
+        if action == 'draw':
+            moves = [(tile, self.plane('wall'), hand)]
+        elif action == 'discard':
+            moves = [(tile, hand, self.plane('discard', seat))]
+        elif action in ('chii', 'pon', 'kan'):
+            if source is None:
+                source = next((entry[1] for entry in reversed(self.history) if entry[0] == 'discard'),
+                              None)
+                if source is None:
+                    raise ValueError('no discard to call')
+            moves = [(tile, self.plane('discard', source), open)]
+            moves += [(other, hand, open) for other in tiles]
+        elif action in ('closed kan', 'added kan'):
+            moves = [(other, hand, open) for other in (tile, *tiles)]
+        else:
+            raise ValueError(f'{action} is not a valid action')
+
+        state = (self.turn, self.last_action, self.last_draw, self.last_discard, self.step,
+                 self.tracker.state())
+        moves = [(other.id, other.isRed, a, b) for other, a, b in moves]
+        for i, move in enumerate(moves):
+            try:
+                self._move(*move)
+            except IndexError:
+                for id, isRed, a, b in reversed(moves[:i]):
+                    self._move(id, isRed, b, a)
+                raise
+        self.history.append((action, seat, moves, state))
+
+        # Players who let the last discard go by are furiten, the discarder's waits are
+        # refreshed right away so the next draw is checked against the hand before it
+        if self.last_action == 'discard' and action in ('draw', 'chii', 'pon', 'kan'):
+            self.tracker.passed(self.turn, self.last_discard.id)
+        for id, isRed, a, b in moves:
+            for plane in (a, b):
+                if plane < self.mode:
+                    self.tracker.hand_changed(plane)
+        if action == 'discard':
+            self.tracker.discard(seat, tile.id)
+        if action in ('discard', 'closed kan', 'added kan'):
+            self.tracker.wait_mask(seat)
+
+        self.turn = seat
+        self.last_action = action
+        if action == 'discard':
+            self.last_discard = tile
+            self.step = False
+        else:
+            self.last_draw = tile if action == 'draw' else self.last_draw
+            self.step = True
+        return source if action in ('chii', 'pon', 'kan') else None
+
+    def undo(self):
+        '''
+        Takes back the last applied action, returns the action and seat that were undone
+        '''
+        action, seat, moves, state = self.history.pop()
+        for id, isRed, a, b in reversed(moves):
+            self._move(id, isRed, b, a)
+        self.turn, self.last_action, self.last_draw, self.last_discard, self.step, tracker = state
+        self.tracker.restore(tracker)
+        for recorder in self.recorders:
+            recorder.undone(self, action, seat)
+        return action, seat
+
+    def _move(self, id, isRed, source, destination):
+        '''
+        Moves one tile between two board planes
+        '''
+        index_remove(self.board[source], id, isRed)
+        try:
+            index_add(self.board[destination], id, isRed)
+        except IndexError:
+            index_add(self.board[source], id, isRed)
+            raise
     
+    def unseen_counts(self, seat, indicators=()):
+        '''
+        Returns the count of each tile ID a player has not seen
+        The full deck minus the player's hand, every open and discard, and indicators, the
+        revealed dora indicators as Tiles or IDs. The dora plane holds the unrevealed ones too
+        '''
+        deck = TileIndex()
+        deck.full_deck(self.mode)
+        seen = [self.plane('hand', seat)]
+        seen += [self.plane(kind, other) for kind in ('open', 'discard') for other in range(self.mode)]
+        counts = deck.index[:, :4].sum(axis=1) - self.board[seen, :, :4].sum(axis=(0, 2))
+        for tile in indicators:
+            counts[getattr(tile, 'id', tile)] -= 1
+        return np.maximum(counts, 0)
+
+    def ukeire(self, seat, indicators=()):
+        '''
+        Tile acceptance of every discard of a player holding 3n + 2 tiles, counting the tiles
+        they have not seen, see Tenpai.ukeire()
+        '''
+        return Tenpai.ukeire(self.board[self.plane('hand', seat)], self.board[self.plane('open', seat)],
+                             self.unseen_counts(seat, indicators))
+
+    def score(self, seat, win, loser=None, dealer=None, dora=None):
+        '''
+        Scores a win of a player with Yaku.score(), counting dora and red tiles
+        win: Tile that completes the hand, the one just drawn for tsumo
+        loser: seat that dealt in for ron, None for tsumo
+        dealer: seat of the dealer, defaults to the one of round
+        dora: DoraIndex of the revealed indicators, None only counts red tiles
+        Returns Score object with transfer reordered by seat, or None if the hand has no yaku
+        '''
+        with phase(self.timer, 'score'):
+            mode = self.mode
+            dealer = (self.round - 1) % mode if dealer is None else dealer
+            hand = self.hands[seat].index
+            counts = hand[:, :4].sum(axis=1)
+            reds = int(np.count_nonzero(hand[:, 4]))
+            if loser is not None:
+                counts[win.id] += 1
+                reds += win.isRed
+            doras = reds if dora is None else int(counts @ dora.weights()) + reds
+            score = Yaku.score(counts, win=win, tsumo=loser is None, seat=(seat - dealer) % mode,
+                               round=self.wind, dora=doras,
+                               loser=None if loser is None else (loser - dealer) % mode, mode=mode)
+            if score is not None:
+                score.transfer = score.transfer[(np.arange(mode) - dealer) % mode]
+            return score
+
     def combine_index(self, index1, index2):
         '''
         Combine two TileIndexes together, same as TileIndex.combine_index()
@@ -158,20 +358,30 @@ class Round(_GameBase):
 
         return new_index
 
-    def check_action(self, in_turn, out_turn):
+    def check_action(self, in_turn=None, out_turn=None, furiten=None, riichi=None):
         '''
         Checks for possible actions (Chii, Pon, Kan, Riichi, etc.) for all players
-        in_turn: str; name of player who is "in turn"
-            If step is after discard (False), that player is the one next to draw
+        in_turn: str; name of player who is "in turn", defaults to the last player to act
             If step is after draw (True), that player is the one that just drew
+        out_turn: str; name of player who discarded, defaults to the last player to act
+            If step is after discard (False), calls are checked on their discard
+        furiten, riichi: bool arrays with one value per player, see DiscardAction.check_calls
+            Default to the state kept by tracker
+        After a draw returns dict with whether the player can tsumo, the IDs they can closed
+        kan and whether they can add to a pon. After a discard returns the masks of
+        DiscardAction.check_calls for all players, checked on the board in one pass
         '''
-        if self.step is True:
-            player_index = self.names.index(in_turn)
-            player = self.players[player_index]
-            if player.isTenpai is True:
-                canTsumo = self.check_tsumo(in_turn, player)
-            canKan, closed_id, can_open = self.check_self_kan(in_turn)
-        else:
-            self.check_ron(out_turn)
-            self.check_chii(in_turn)
-            self.check_pon_kan(out_turn)
\ No newline at end of file
+        with phase(self.timer, 'check_action'):
+            hands = self.board[:self.mode]
+            opens = self.board[self.mode:2 * self.mode]
+            if self.step is True:
+                seat = self.turn if in_turn is None else self.names.index(in_turn)
+                canTsumo = self.tracker.is_winning(seat, self.last_draw.id)
+                canClosedKan, closed_id, canOpenKan = DrawAction.check_self_kan(hands[seat], opens[seat],
+                                                                                self.last_draw)
+                return {'tsumo': canTsumo, 'closed kan': closed_id, 'added kan': canOpenKan}
+            else:
+                seat = self.turn if out_turn is None else self.names.index(out_turn)
+                furiten = self.tracker.furiten_mask() if furiten is None else furiten
+                riichi = self.tracker.riichi if riichi is None else riichi
+                return DiscardAction.check_calls(hands, self.last_discard, seat, opens, furiten, riichi)
\ No newline at end of file
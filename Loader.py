@@ -0,0 +1,129 @@
+import threading
+import queue
+from pathlib import Path
+import numpy as np
+import h5py as h5
+'''
+Define GameLoader class, which reads back the gameboards written by Logger.GameLogger
+- Boards are read one HDF5 chunk at a time, so a file is never loaded into memory whole
+- A background thread reads and batches ahead of the consumer, up to prefetch batches
+- With a shuffle buffer, chunk order is shuffled and batches are drawn at random from a
+  pool of shuffle_buffer boards
+'''
+
+class GameLoader:
+    '''
+    Iterates logged gameboards in batch x planes x 34 x 5 bool arrays
+    paths: log file or list of log files, all with the same number of planes
+    batch_size: number of gameboards per batch, the last batch may be smaller
+    shuffle_buffer: number of boards to draw batches from at random, 0 keeps file order
+    prefetch: number of batches read ahead by the background thread
+    seed: int, numpy Generator or None; seeds the shuffling
+    keys: names of the planes, same as the Round.gameboard keys of the first logged board
+    '''
+    def __init__(self, paths, batch_size=256, shuffle_buffer=0, prefetch=4, seed=None):
+        self.paths = [Path(paths)] if isinstance(paths, (str, Path)) else [Path(p) for p in paths]
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.prefetch = prefetch
+        self.rng = np.random.default_rng(seed)
+
+        self.planes = None
+        self.keys = None
+        self.chunks = []
+        for path in self.paths:
+            with h5.File(path, 'r') as file:
+                if 'boards' not in file:
+                    continue
+                boards = file['boards']
+                if self.planes is None:
+                    self.planes = boards.shape[1]
+                    self.keys = list(file.attrs.get('keys', []))
+                elif boards.shape[1] != self.planes:
+                    raise ValueError(f'{path} has {boards.shape[1]} planes, not {self.planes}')
+                step = boards.chunks[0]
+                self.chunks += [(path, start, min(start + step, len(boards)))
+                                for start in range(0, len(boards), step)]
+
+    def __len__(self):
+        '''
+        Number of batches in one pass
+        '''
+        boards = sum(stop - start for _, start, stop in self.chunks)
+        return -(-boards // self.batch_size)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read, args=(batches, stop), daemon=True)
+        reader.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            # Unblock the reader if the consumer stops early
+            stop.set()
+            while reader.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    reader.join(0.01)
+
+    def _put(self, batches, stop, batch):
+        '''
+        Puts a batch on the queue unless the consumer has stopped, returns False if it has
+        '''
+        while not stop.is_set():
+            try:
+                batches.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self, batches, stop):
+        '''
+        Background thread that reads chunks in order and puts batches on the queue
+        '''
+        try:
+            order = self.chunks
+            if self.shuffle_buffer > 0:
+                order = [self.chunks[i] for i in self.rng.permutation(len(self.chunks))]
+            files = {}
+            pool = np.empty((0, self.planes or 0, 34, 5), dtype=bool)
+            threshold = max(self.batch_size, self.shuffle_buffer)
+            try:
+                for path, start, stop_row in order:
+                    if path not in files:
+                        files[path] = h5.File(path, 'r')
+                    pool = np.concatenate((pool, files[path]['boards'][start:stop_row]))
+                    while len(pool) >= threshold:
+                        batch, pool = self._take(pool)
+                        if not self._put(batches, stop, batch):
+                            return
+            finally:
+                for file in files.values():
+                    file.close()
+
+            # Drain the rest of the pool
+            while len(pool) > 0:
+                batch, pool = self._take(pool)
+                if not self._put(batches, stop, batch):
+                    return
+            self._put(batches, stop, None)
+        except Exception as error:
+            self._put(batches, stop, error)
+
+    def _take(self, pool):
+        '''
+        Splits one batch off the pool, at random if shuffling
+        '''
+        if self.shuffle_buffer > 0:
+            picked = self.rng.choice(len(pool), min(self.batch_size, len(pool)), replace=False)
+            return pool[picked], np.delete(pool, picked, axis=0)
+        return pool[:self.batch_size], pool[self.batch_size:]
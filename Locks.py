@@ -0,0 +1,29 @@
+import os
+import time
+from contextlib import contextmanager
+'''
+Lock files shared by the modules that write files other processes read, see
+Logger.allocate_game_ids() and Tables.load_table()
+'''
+
+@contextmanager
+def locked(path, timeout=10.0):
+    '''
+    Holds a lock file next to path for the duration of the block
+    Raises TimeoutError if the lock is not free within timeout seconds
+    '''
+    lock_path = f'{path}.lock'
+    start = time.monotonic()
+    while True:
+        try:
+            lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f'could not lock {path}, remove {lock_path} if it is stale')
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(lock)
+        os.remove(lock_path)
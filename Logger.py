@@ -0,0 +1,203 @@
+import os
+import atexit
+from pathlib import Path
+import numpy as np
+
+from Locks import locked
+from Profiler import phase
+'''
+Define GameLogger class, and functions to load the globals and allocate game IDs
+- Game IDs are allocated under a lock file and saved back to globals.yml right away, so
+  processes logging the same game type never get the same ID
+- Many games are appended to one chunked, compressed HDF5 file with resizable datasets.
+  Games are kept in memory and written in batches of flush_games
+- HDF5 files only take one writer, so each process should log to its own file
+- h5py and yaml are only imported on first use, so processes that never log don't load them
+'''
+
+# Set script path to current directory
+script_path = Path(__file__, '..').resolve()
+globals_path = script_path.joinpath('globals.yml')
+
+_globals = {}
+
+def load_globals(path=globals_path):
+    '''
+    Returns the contents of globals.yml, read once on first use
+    '''
+    key = Path(path).resolve()
+    if key not in _globals:
+        import yaml
+        with open(path, "r") as globalsfile:
+            _globals[key] = yaml.safe_load(globalsfile)
+    return _globals[key]
+
+def allocate_game_ids(game_type, n=1, path=globals_path):
+    '''
+    Allocates n consecutive game IDs for game_type and saves the next free ID back to path
+    game_ids in globals.yml hold the next free ID of each game type
+    Returns range of allocated IDs
+    '''
+    import yaml
+    with locked(path):
+        with open(path, "r") as globalsfile:
+            config = yaml.safe_load(globalsfile)
+        game_ids = config.setdefault('game_ids', {})
+        start = int(game_ids.get(str(game_type), 0))
+        game_ids[str(game_type)] = start + n
+
+        # Write to a temporary file first so a crash never leaves globals.yml half written
+        temp_path = f'{path}.tmp'
+        with open(temp_path, "w") as globalsfile:
+            yaml.safe_dump(config, globalsfile, default_flow_style=None, sort_keys=False)
+        os.replace(temp_path, path)
+
+    return range(start, start + n)
+
+class GameLogger:
+    '''
+    Appends logged games to one HDF5 file
+    path: file to append to, created if it doesn't exist
+    flush_games: number of finished games kept in memory before writing them out
+    chunk_boards: number of gameboards per HDF5 chunk
+    File layout:
+    attrs: number of planes, and the gameboard keys when dicts were logged
+    boards: M x planes x 34 x 5 bool; gameboards of every game, one after the other, created
+        with the first gameboard
+    game_id, mode, names: ID, number of players and player names of each game
+    board_start, board_count: where the gameboards of each game are in boards
+    '''
+    def __init__(self, path, flush_games=64, chunk_boards=256):
+        import h5py as h5
+        self.path = Path(path)
+        self.flush_games = flush_games
+        self.chunk_boards = chunk_boards
+        self.file = h5.File(self.path, 'a')
+        self.pending = []
+        self.current = None
+        self.keys = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _create_boards(self, planes):
+        '''
+        Creates the empty resizable boards dataset, with the plane count of the first gameboard
+        '''
+        self.file.attrs['planes'] = planes
+        if self.keys is not None:
+            self.file.attrs['keys'] = self.keys
+        self.file.create_dataset('boards', (0, planes, 34, 5), dtype=bool,
+                                 maxshape=(None, planes, 34, 5),
+                                 chunks=(self.chunk_boards, planes, 34, 5),
+                                 compression='gzip', compression_opts=4, shuffle=True)
+
+    def _create_games(self):
+        '''
+        Creates the empty resizable datasets of the games
+        '''
+        import h5py as h5
+        for name, dtype in (('game_id', np.int64), ('mode', np.int8),
+                            ('board_start', np.int64), ('board_count', np.int32)):
+            self.file.create_dataset(name, (0, ), dtype=dtype, maxshape=(None, ), chunks=(1024, ))
+        self.file.create_dataset('names', (0, 4), dtype=h5.string_dtype(),
+                                 maxshape=(None, 4), chunks=(1024, 4))
+
+    def start_game(self, game_id, mode, names):
+        '''
+        Starts buffering a new game, the previous one has to be ended first
+        '''
+        if self.current is not None:
+            raise RuntimeError('previous game has not been ended')
+        names = list(names) + [''] * (4 - len(names))
+        self.current = {'game_id': game_id, 'mode': mode, 'names': names, 'boards': []}
+
+    def log_board(self, gameboard):
+        '''
+        Buffers one gameboard of the current game
+        gameboard: dict of 34 x 5 indexes as in Round.gameboard, or a planes x 34 x 5 array
+        '''
+        if self.current is None:
+            raise RuntimeError('no game has been started')
+        if isinstance(gameboard, dict):
+            if self.keys is None:
+                self.keys = list(gameboard.keys())
+            gameboard = np.stack(list(gameboard.values()))
+        else:
+            gameboard = np.array(gameboard, dtype=bool)
+        self.current['boards'].append(gameboard)
+
+    def end_game(self, timer=None):
+        '''
+        Ends the current game, writing out all buffered games once flush_games are waiting
+        timer: PhaseTimer to time the write with as 'log flush', None for no timing
+        '''
+        if self.current is None:
+            raise RuntimeError('no game has been started')
+        self.pending.append(self.current)
+        self.current = None
+        if len(self.pending) >= self.flush_games:
+            with phase(timer, 'log flush'):
+                self.flush()
+
+    def flush(self):
+        '''
+        Writes all ended games to the file with one resize and write per dataset
+        '''
+        if len(self.pending) == 0:
+            return
+        counts = np.array([len(game['boards']) for game in self.pending], dtype=np.int32)
+        boards = [board for game in self.pending for board in game['boards']]
+        if 'game_id' not in self.file:
+            self._create_games()
+        if 'boards' not in self.file and len(boards) != 0:
+            self._create_boards(boards[0].shape[0])
+        if len(boards) != 0 and any(board.shape != self.file['boards'].shape[1:] for board in boards):
+            raise ValueError('gameboard shape does not match the boards in this file')
+
+        n_boards = self.file['boards'].shape[0] if 'boards' in self.file else 0
+        starts = n_boards + np.concatenate(([0], np.cumsum(counts)[:-1]))
+        columns = {'game_id': [game['game_id'] for game in self.pending],
+                   'mode': [game['mode'] for game in self.pending],
+                   'names': [game['names'] for game in self.pending],
+                   'board_start': starts, 'board_count': counts}
+        n_games = self.file['game_id'].shape[0]
+        for name, values in columns.items():
+            dataset = self.file[name]
+            dataset.resize(n_games + len(self.pending), axis=0)
+            dataset[n_games:] = values
+        if len(boards) != 0:
+            self.file['boards'].resize(n_boards + len(boards), axis=0)
+            self.file['boards'][n_boards:] = np.stack(boards)
+        self.file.flush()
+        self.pending = []
+
+    def close(self):
+        '''
+        Flushes pending games and closes the file, a game that was not ended is dropped
+        '''
+        if self.file.id.valid:
+            self.flush()
+            self.file.close()
+        _loggers.pop(self.path.resolve(), None)
+
+    @staticmethod
+    def shared(path, **kwargs):
+        '''
+        Returns the logger already open for path in this process, or opens one
+        Shared loggers are closed at exit
+        '''
+        key = Path(path).resolve()
+        if key not in _loggers:
+            _loggers[key] = GameLogger(path, **kwargs)
+        return _loggers[key]
+
+_loggers = {}
+
+@atexit.register
+def _close_loggers():
+    for logger in list(_loggers.values()):
+        logger.close()
@@ -1,10 +1,9 @@
 import numpy as np
 
-from Tile import Tile, TileIndex
-from Game import Game, Round
-from Action import DiscardAction
+from Tile import Tile, TileIndex, TileIndexBatch
 
 def main():
+    from Game import Game, Round
 
     # Define game type
     mode = int(input('Enter number of players: '))
@@ -16,10 +15,11 @@ def main():
     hands, hands_index, wall, wall_index, dora_indicators, doras_index, deck = shuffle(mode)
     round = Round(mode=mode, hands=hands_index, wall=wall_index, doras=doras_index, deck=deck)
 
-def shuffle(mode):
+def shuffle(mode, seed=None):
     '''
     Shuffles tiles. 
     mode: int; 3 or 4 players
+    seed: int, numpy Generator or None; seeds the shuffle, see deal()
     Returns:
     hands: mode x 14 array of Tile objects with each player's hand
     hands_index: list of TileIndex objects for each player's hand
@@ -30,85 +30,104 @@ def shuffle(mode):
     deck: TileIndex object for the remaining cards in the deck (dead cards)
     Arrays of Tile objects will be fed to graphics, lists of TileIndex will be fed to NN
     '''
-    # Initialize full deck of tiles
-    deck = TileIndex()
-    deck.full_deck(mode)
-
-    # Create array that contains the denominator of the probability to pick a red tile
-    reds = np.array([4, 4, 4])
-
-    # Initialize a tile picker that contains all tile IDs
-    # ID of a tile will be removed if out of such tile
-    picker = np.linspace(0, 33, 34)
-    if mode == 3:
-        picker = np.delete(picker, np.s_[1:8])
+    ids, reds = deal(1, mode, seed)
+    ids, reds = ids[0].tolist(), reds[0].tolist()
+    tiles = [Tile.of(id, isRed) for id, isRed in zip(ids, reds)]
+    layout = deal_layout(mode)
 
-    # Initialize and pick hands and hands_index
+    # Hands have an empty 14th slot for the drawn tile
     hands = np.ndarray((mode, ), dtype=Tile)
-    hands_index = np.ndarray((mode, ), dtype=TileIndex)
-    for i in range(mode):
-        tiles, index, deck, picker, reds = tile_picker(13, deck, picker, reds)
-        tiles = np.append(tiles, None)
-        hands[i] = tiles
-        hands_index[i] = index
-    
-    # Determine wall length, initialize and pick wall and wall_index
-    wall_len = 55 if mode == 3 else 70
-    wall, wall_index, deck, picker, reds = tile_picker(wall_len, deck, picker, reds)
-
-    # Initialize and pick doras and doras_index
+    for i, part in enumerate(layout['hands']):
+        hands[i] = np.array(tiles[part] + [None])
+    wall = np.array(tiles[layout['wall']])
     dora_indicators = np.ndarray((2, ), dtype=Tile)
+    for i, part in enumerate(layout['doras']):
+        dora_indicators[i] = np.array(tiles[part])
+
+    indexes = deal_indexes(np.array([ids]), np.array([reds]), mode)
+    hands_index = np.ndarray((mode, ), dtype=TileIndex)
+    hands_index[:] = indexes['hands'].to_indexes()
     doras_index = np.ndarray((2, ), dtype=TileIndex)
-    for i in range(2):
-        tiles, index, deck, picker, reds = tile_picker(5, deck, picker, reds)
-        dora_indicators[i] = tiles
-        doras_index[i] = index
+    doras_index[:] = indexes['doras'].to_indexes()
+    wall_index = indexes['wall'].to_indexes()[0]
+    deck = indexes['deck'].to_indexes()[0]
 
     return hands, hands_index, wall, wall_index, dora_indicators, doras_index, deck
 
-def tile_picker(n, deck, picker, reds):
+def deal(n, mode, seed=None):
     '''
-    Function to automate tile picking. 
-    n: int; number of times to pick
-    deck: TileIndex; index for tiles available to pick
-    picker: 1D array; IDs of tiles available to pick
-    reds: iD array; encodes probability for red tiles
+    Deals n rounds at once by permuting the full tile multiset of each round
+    n: int; number of rounds
+    mode: int; 3 or 4 players
+    seed: int, numpy Generator or None; same seed gives the same deals
     Returns:
-    tiles: numpy array of Tile objects
-    index: TileIndex object for array of tiles
-    deck: TileIndex for remaining tiles in deck
-    picker: picker array after tile picking
-    reds: reds array after tile picking
+    ids: n x 136 (n x 108 for 3 players) int8 array of tile IDs in deal order
+    reds: bool array of the same shape, whether each tile is red
+    Use deal_layout() to split a row into hands, wall, doras and deck
+    '''
+    rng = np.random.default_rng(seed)
+    ids, reds = _full_deck(mode)
+    order = rng.permuted(np.tile(np.arange(len(ids), dtype=np.int16), (n, 1)), axis=1)
+    return ids[order], reds[order]
+
+def deal_layout(mode):
+    '''
+    Returns the slices of a dealt row for each part of the round
+    hands: list of mode slices of 13 tiles; wall: slice; doras: list of 2 slices of 5 tiles,
+    one for dora and one for ura dora; deck: slice of the remaining dead tiles
+    '''
+    if mode not in (3, 4):
+        raise ValueError('not a valid game mode')
+
+    wall_len = 55 if mode == 3 else 70
+    hands = [slice(13 * i, 13 * (i + 1)) for i in range(mode)]
+    wall_start = 13 * mode
+    dora_start = wall_start + wall_len
+    return {'hands': hands, 
+            'wall': slice(wall_start, dora_start), 
+            'doras': [slice(dora_start, dora_start + 5), slice(dora_start + 5, dora_start + 10)],
+            'deck': slice(dora_start + 10, None)}
+
+def deal_indexes(ids, reds, mode):
+    '''
+    Builds a TileIndexBatch for each part of n dealt rounds, see deal()
+    Returns dict of TileIndexBatch objects:
+    hands: n * mode hands, round by round; wall: n walls; doras: n * 2 indexes, dora then
+    ura dora for each round; deck: n decks of remaining dead tiles
+    '''
+    layout = deal_layout(mode)
+    n = len(ids)
+    hands = [np.stack([ids[:, part] for part in layout['hands']], axis=1).reshape(n * mode, -1),
+             np.stack([reds[:, part] for part in layout['hands']], axis=1).reshape(n * mode, -1)]
+    doras = [np.stack([ids[:, part] for part in layout['doras']], axis=1).reshape(n * 2, -1),
+             np.stack([reds[:, part] for part in layout['doras']], axis=1).reshape(n * 2, -1)]
+    return {'hands': _batch(*hands), 
+            'wall': _batch(ids[:, layout['wall']], reds[:, layout['wall']]), 
+            'doras': _batch(*doras), 
+            'deck': _batch(ids[:, layout['deck']], reds[:, layout['deck']])}
+
+def _full_deck(mode):
+    '''
+    Returns the tile IDs and red flags of every tile in a full deck, in ID order
+    The first of each five is the red one, to match TileIndex.full_deck()
+    '''
+    deck = TileIndex()
+    deck.full_deck(mode)
+    counts = deck.index[:, :4].sum(axis=1)
+    ids = np.repeat(np.arange(34, dtype=np.int8), counts)
+    reds = np.zeros(len(ids), dtype=bool)
+    reds[np.searchsorted(ids, np.where(deck.index[:, 4])[0])] = True
+    return ids, reds
+
+def _batch(ids, reds):
+    '''
+    Builds a TileIndexBatch with one hand per row of tile IDs and red flags
     '''
-    # Initialize tiles and index
-    tiles = np.array([])
-    index = TileIndex()
-
-    # Loop n times to pick tiles and add to tiles and index
-    for i in range(n):
-        id = int(np.random.choice(picker))
-        # Check if a five was picked to decide if it's red
-        if id in (4, 13, 22):
-            redtype = (id - 4) // 9
-            if reds[redtype] > 0:
-                redprob = np.array([True if i == 0 else False for i in range(reds[redtype])])
-                isRed = bool(np.random.choice(redprob))
-                reds[redtype] = 0 if isRed is True else reds[redtype] - 1
-            else:
-                isRed = False
-        else:
-            isRed = False
-        # Add tile to tiles and index
-        tile = Tile(id, isRed)
-        index.add(tile)
-        tiles = np.append(tiles, tile)
-        # Remove tile from deck
-        deck.remove(tile)
-        # Remove ID of tile from picker if that was the last of its type
-        if not any(deck.index[id]):
-            picker = np.delete(picker, np.where(picker == id))
-    
-    return tiles, index, deck, picker, reds
+    rows = np.repeat(np.arange(len(ids)), ids.shape[1]).reshape(ids.shape)
+    counts = np.bincount((rows * 34 + ids).ravel(), minlength=len(ids) * 34)
+    batch_reds = np.zeros((len(ids), 34), dtype=bool)
+    batch_reds[rows[reds], ids[reds]] = True
+    return TileIndexBatch(counts.reshape(len(ids), 34).astype(np.int8), batch_reds)
 
 if __name__ == "__main__": 
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,9 @@
 from dataclasses import dataclass, field
 import numpy as np
-from Tile import Tile, TileIndex
+from Tile import Tile, TileIndex, ids_to_mask
+from Tenpai import Tenpai
 '''
-Define Player dataclass
+Define Player and WaitTracker dataclasses
 '''
 @dataclass
 class Player:
@@ -14,7 +15,6 @@ class Player:
     hand: np.ndarray = field(default_factory=lambda: np.full((14, ), None, dtype=Tile), repr=False)
     open: np.ndarray = field(default_factory=lambda: np.full((16, ), None, dtype=Tile), repr=False)
     discards: np.ndarray = field(default_factory=lambda: np.array([]), repr=False)
-    waits: np.ndarray = field(default_factory=np.array([]), repr=False)
     doras: int = field(default=0, repr=False)
     canChii: bool = field(default=False, repr=False)
     canPon: bool = field(default=False, repr=False)
@@ -24,10 +24,124 @@ class Player:
     canRon: bool = field(default=False, repr=False)
     canTsumo: bool = field(default=False, repr=False)
     isRiichi: bool = field(default=False, repr=False)
-    isTenpai: bool = field(default=False, repr=False)
-    isFuriten: bool = field(default=False, repr=False)
     isWon: bool = field(default=False, repr=False)
 
 @dataclass
 class PlayerIndex:
     pass
+
+@dataclass
+class WaitTracker:
+    '''
+    Keeps every player's waits and furiten state for a round
+    hands: closed hand indexes of every player, usually the hand planes of Round.board
+    opens: called tile indexes of every player, chitoitsu and kokushi need them empty
+    waits: 34 bit mask of each player's waits, recomputed only after their hand changed
+    discards: 34 bit mask of the tiles each player has discarded, for permanent furiten
+    temporary: whether each player passed on a winning tile since their last discard
+    riichi: whether each player is in riichi
+    riichi_furiten: whether each player passed on a winning tile after riichi
+    '''
+    hands: list = field(repr=False)
+    opens: list = field(default=None, repr=False)
+    waits: list = field(init=False)
+    discards: list = field(init=False)
+    temporary: list = field(init=False)
+    riichi: list = field(init=False)
+    riichi_furiten: list = field(init=False)
+    changed: list = field(init=False, repr=False)
+
+    def __post_init__(self):
+        players = len(self.hands)
+        self.waits = [0] * players
+        self.discards = [0] * players
+        self.temporary = [False] * players
+        self.riichi = [False] * players
+        self.riichi_furiten = [False] * players
+        self.changed = [True] * players
+
+        # Waits of the dealt hands are needed on the first draw, before anyone has discarded
+        for seat in range(players):
+            self.wait_mask(seat)
+
+    def hand_changed(self, seat):
+        '''
+        Marks a player's waits to be recomputed the next time they are needed
+        '''
+        self.changed[seat] = True
+
+    def wait_mask(self, seat):
+        '''
+        Returns the waits of a player as a 34 bit mask
+        Waits are only recomputed for 3n + 1 tile hands, so after a draw or call they are the
+        waits the hand had before it
+        '''
+        if self.changed[seat] is True:
+            hand = self.hands[seat]
+            if np.count_nonzero(hand[:, :4]) % 3 == 1:
+                open = None if self.opens is None else self.opens[seat]
+                self.waits[seat] = ids_to_mask(Tenpai.check_waits(hand, open))
+                self.changed[seat] = False
+        return self.waits[seat]
+
+    def is_tenpai(self, seat):
+        return self.wait_mask(seat) != 0
+
+    def is_winning(self, seat, id):
+        '''
+        Checks if tile id completes the player's hand, furiten is not checked
+        '''
+        return bool((self.wait_mask(seat) >> id) & 1)
+
+    def is_furiten(self, seat):
+        '''
+        Checks for permanent, temporary and riichi furiten with one bitwise and
+        '''
+        return (self.temporary[seat] or self.riichi_furiten[seat]
+                or self.wait_mask(seat) & self.discards[seat] != 0)
+
+    def can_ron(self, seat, id):
+        return self.is_winning(seat, id) and not self.is_furiten(seat)
+
+    def furiten_mask(self):
+        '''
+        Returns bool array of is_furiten for every player
+        '''
+        return np.array([self.is_furiten(seat) for seat in range(len(self.hands))])
+
+    def discard(self, seat, id):
+        '''
+        Records a discard, which also ends the player's temporary furiten
+        '''
+        self.discards[seat] |= 1 << id
+        self.temporary[seat] = False
+        self.changed[seat] = True
+
+    def passed(self, discarder, id):
+        '''
+        Puts every player who could have won on a discard but didn't into furiten
+        '''
+        for seat in range(len(self.hands)):
+            if seat != discarder and self.is_winning(seat, id):
+                self.temporary[seat] = True
+                if self.riichi[seat] is True:
+                    self.riichi_furiten[seat] = True
+
+    def declare_riichi(self, seat):
+        self.riichi[seat] = True
+
+    def state(self):
+        '''
+        Returns the waits and furiten state, to be put back with restore()
+        '''
+        return (tuple(self.waits), tuple(self.changed), tuple(self.discards),
+                tuple(self.temporary), tuple(self.riichi), tuple(self.riichi_furiten))
+
+    def restore(self, state):
+        waits, changed, discards, temporary, riichi, riichi_furiten = state
+        self.waits = list(waits)
+        self.changed = list(changed)
+        self.discards = list(discards)
+        self.temporary = list(temporary)
+        self.riichi = list(riichi)
+        self.riichi_furiten = list(riichi_furiten)
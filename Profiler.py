@@ -0,0 +1,100 @@
+import time
+import functools
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+'''
+Define PhaseTimer class, which times the phases of self-play (deal, draw, check_action,
+discard, score, log flush)
+- Game and Round time their phases themselves with phase(), given the PhaseTimer they were
+  made with, and a round made without one costs only an empty with block per phase
+- Every call is counted, but only one in sample calls is timed. Phase totals are estimated
+  from the mean of the timed calls
+- Timers of several processes are combined with merge(), and exported with stats()/export()
+'''
+
+_NULL = nullcontext()
+
+class PhaseTimer:
+    '''
+    Counts and times named phases
+    sample: time one in sample calls of each phase, 1 times every call
+    calls, timed: number of calls and timed calls of each phase
+    seconds: total seconds of the timed calls of each phase
+    '''
+    def __init__(self, sample=1):
+        self.sample = sample
+        self.calls = Counter()
+        self.timed = Counter()
+        self.seconds = Counter()
+
+    def wrap(self, phase, function):
+        '''
+        Returns function wrapped to count and time its calls
+        phase: name of the phase, or a function of the call's arguments that returns it
+        '''
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            name = phase(*args, **kwargs) if callable(phase) else phase
+            self.calls[name] += 1
+            if self.calls[name] % self.sample != 0:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.timed[name] += 1
+                self.seconds[name] += time.perf_counter() - start
+        return timed
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Counts and times the block as one call of phase name
+        '''
+        self.calls[name] += 1
+        if self.calls[name] % self.sample != 0:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timed[name] += 1
+            self.seconds[name] += time.perf_counter() - start
+
+    def merge(self, other):
+        '''
+        Adds the counts and times of another PhaseTimer into this one
+        '''
+        self.calls.update(other.calls)
+        self.timed.update(other.timed)
+        self.seconds.update(other.seconds)
+
+    def stats(self):
+        '''
+        Returns dict of phase: dict with calls, timed calls, mean milliseconds per call and
+        estimated total seconds, phases ordered by total
+        '''
+        stats = {}
+        for name, calls in self.calls.items():
+            timed = self.timed[name]
+            mean = self.seconds[name] / timed if timed > 0 else 0.0
+            stats[name] = {'calls': calls, 'timed': timed, 'mean ms': mean * 1000,
+                           'seconds': mean * calls}
+        return dict(sorted(stats.items(), key=lambda item: -item[1]['seconds']))
+
+    def export(self, path):
+        '''
+        Writes stats() to a yaml file
+        '''
+        import yaml
+        stats = {name: {key: round(float(value), 6) if isinstance(value, float) else value
+                        for key, value in phase.items()} for name, phase in self.stats().items()}
+        with open(path, "w") as statsfile:
+            yaml.safe_dump(stats, statsfile, sort_keys=False)
+
+def phase(timer, name):
+    '''
+    Returns timer.phase(name), or a context that does nothing if timer is None
+    '''
+    return _NULL if timer is None else timer.phase(name)
@@ -0,0 +1,337 @@
+from pathlib import Path
+import numpy as np
+
+from Tile import Tile, index_add, index_remove
+from Profiler import phase
+'''
+Define ReplayLogger and ReplayReader classes, which store rounds as their actions instead of
+gameboard snapshots
+- A round is stored as its starting board (or the seed it was dealt from) and one 16 bit event
+  per tile moved, packed as source << 12 | seat << 10 | action << 7 | id << 1 | isRed
+- Calls take one event for the called tile, with source the seat whose discard is called plus
+  one, and one MELD event for each tile from the hand. Other events have source 0
+- Every keyframe_every events the whole board is stored bit packed, so any turn is rebuilt
+  from the keyframe before it and the events after it
+- ReplayLogger has the same game interface as Logger.GameLogger, so it can be passed as the log
+  of a Game, see Game.start_round()
+'''
+
+ACTIONS = ('draw', 'discard', 'chii', 'pon', 'kan', 'closed kan', 'added kan', 'meld')
+MELD = ACTIONS.index('meld')
+_CALLS = ('chii', 'pon', 'kan')
+
+def encode(seat, action, tile, source=None):
+    '''
+    Packs one event into an int, action is a name in ACTIONS
+    source: seat whose discard is called, for the called tile of a call
+    '''
+    source = 0 if source is None else source + 1
+    return source << 12 | seat << 10 | ACTIONS.index(action) << 7 | tile.id << 1 | int(tile.isRed)
+
+def decode(events):
+    '''
+    Unpacks an array of events into source, seat, action number, tile ID and red flag arrays
+    source is the called seat plus one, 0 if the event has none
+    '''
+    events = np.asarray(events, dtype=np.uint16)
+    return (events >> 12, (events >> 10) & 3, (events >> 7) & 7, (events >> 1) & 63,
+            (events & 1).astype(bool))
+
+def board_planes(mode):
+    '''
+    Number of board planes of a round, see Round.gameboard
+    '''
+    return 3 * mode + 4
+
+class ReplayLogger:
+    '''
+    Appends replays of logged games to one HDF5 file
+    path: file to append to, created if it doesn't exist
+    flush_games: number of finished games kept in memory before writing them out
+    keyframe_every: number of events between stored boards
+    File layout:
+    events: uint16; events of every round, one after the other
+    keyframes: uint8 rows of bit packed boards, padded to the 4 player board size
+    keyframe_event: number of events of its round applied to each keyframe
+    game_id, names: ID and player names of each game
+    round_game, mode, seed: game ID, number of players and seed (-1 if none) of each round
+    event_start, event_count, keyframe_start, keyframe_count: where each round's events and
+        keyframes are; a round dealt from a seed has no keyframe 0
+    '''
+    def __init__(self, path, flush_games=64, keyframe_every=64):
+        import h5py as h5
+        self.path = Path(path)
+        self.flush_games = flush_games
+        self.keyframe_every = keyframe_every
+        self.file = h5.File(self.path, 'a')
+        self.pending = []
+        self.current = None
+        self.round = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start_game(self, game_id, mode, names):
+        '''
+        Starts buffering a new game, the previous one has to be ended first
+        '''
+        if self.current is not None:
+            raise RuntimeError('previous game has not been ended')
+        names = list(names) + [''] * (4 - len(names))
+        self.current = {'game_id': game_id, 'mode': mode, 'names': names, 'rounds': []}
+
+    def start_round(self, round, seed=None):
+        '''
+        Starts recording a round, every action applied to it from now on is logged
+        round: Round object with no actions applied yet
+        seed: int seed the round was dealt from with Mahjong.shuffle(), stored instead of
+            the starting board
+        '''
+        if self.current is None:
+            raise RuntimeError('no game has been started')
+        self.round = {'mode': round.mode, 'seed': -1 if seed is None else seed, 'board': round.board,
+                      'events': [], 'sizes': [], 'keyframes': [], 'keyframe_event': [],
+                      'next_keyframe': self.keyframe_every}
+        if seed is None:
+            self._keyframe(self.round)
+        self.current['rounds'].append(self.round)
+
+        round.recorders.append(_Recorder(self, self.round))
+
+    def log_action(self, action, seat, tile, tiles=(), recording=None, source=None):
+        '''
+        Logs one applied action of the round being recorded
+        source: seat whose discard is called, see Round.apply()
+        '''
+        recording = self.round if recording is None else recording
+        events = [encode(seat, action, tile, source)] + [encode(seat, 'meld', other) for other in tiles]
+        recording['events'] += events
+        recording['sizes'].append(len(events))
+        if len(recording['events']) >= recording['next_keyframe']:
+            self._keyframe(recording)
+
+    def undo_action(self, recording=None):
+        '''
+        Takes the last action back out of the round being recorded
+        '''
+        recording = self.round if recording is None else recording
+        size = recording['sizes'].pop()
+        del recording['events'][len(recording['events']) - size:]
+        frames = recording['keyframe_event']
+        while len(frames) > 0 and frames[-1] > len(recording['events']):
+            recording['keyframes'].pop()
+            frames.pop()
+        recording['next_keyframe'] = (frames[-1] if len(frames) > 0 else 0) + self.keyframe_every
+
+    def _keyframe(self, recording):
+        '''
+        Stores the board of a round as it is now
+        '''
+        recording['keyframes'].append(np.packbits(recording['board']))
+        recording['keyframe_event'].append(len(recording['events']))
+        recording['next_keyframe'] = len(recording['events']) + self.keyframe_every
+
+    def log_board(self, gameboard):
+        '''
+        Boards are rebuilt from the events, so snapshots are not stored
+        '''
+        pass
+
+    def end_game(self, timer=None):
+        '''
+        Ends the current game, writing out all buffered games once flush_games are waiting
+        timer: PhaseTimer to time the write with as 'log flush', None for no timing
+        '''
+        if self.current is None:
+            raise RuntimeError('no game has been started')
+        for round in self.current['rounds']:
+            round.pop('board', None)
+            round.pop('sizes', None)
+        self.pending.append(self.current)
+        self.current = None
+        self.round = None
+        if len(self.pending) >= self.flush_games:
+            with phase(timer, 'log flush'):
+                self.flush()
+
+    def _create(self):
+        '''
+        Creates the empty resizable datasets
+        '''
+        import h5py as h5
+        width = len(np.packbits(np.zeros((board_planes(4), 34, 5), dtype=bool)))
+        self.file.create_dataset('events', (0, ), dtype=np.uint16, maxshape=(None, ),
+                                 chunks=(65536, ), compression='gzip', shuffle=True)
+        self.file.create_dataset('keyframes', (0, width), dtype=np.uint8, maxshape=(None, width),
+                                 chunks=(256, width), compression='gzip')
+        for name, dtype in (('keyframe_event', np.int32), ('game_id', np.int64),
+                            ('round_game', np.int64), ('mode', np.int8), ('seed', np.int64),
+                            ('event_start', np.int64), ('event_count', np.int32),
+                            ('keyframe_start', np.int64), ('keyframe_count', np.int32)):
+            self.file.create_dataset(name, (0, ), dtype=dtype, maxshape=(None, ), chunks=(1024, ))
+        self.file.create_dataset('names', (0, 4), dtype=h5.string_dtype(),
+                                 maxshape=(None, 4), chunks=(1024, 4))
+
+    def flush(self):
+        '''
+        Writes all ended games to the file with one resize and write per dataset
+        '''
+        if len(self.pending) == 0:
+            return
+        if 'events' not in self.file:
+            self._create()
+        rounds = [(game['game_id'], round) for game in self.pending for round in game['rounds']]
+        width = self.file['keyframes'].shape[1]
+        events = [np.array(round['events'], dtype=np.uint16) for _, round in rounds]
+        keyframes = [np.zeros((len(round['keyframes']), width), dtype=np.uint8) for _, round in rounds]
+        for frames, (_, round) in zip(keyframes, rounds):
+            for row, frame in zip(frames, round['keyframes']):
+                row[:len(frame)] = frame
+        event_counts = np.array([len(e) for e in events], dtype=np.int64)
+        keyframe_counts = np.array([len(k) for k in keyframes], dtype=np.int64)
+        n_events = self.file['events'].shape[0]
+        n_keyframes = self.file['keyframes'].shape[0]
+
+        columns = {'game_id': [game['game_id'] for game in self.pending],
+                   'names': [game['names'] for game in self.pending],
+                   'round_game': [game_id for game_id, _ in rounds],
+                   'mode': [round['mode'] for _, round in rounds],
+                   'seed': [round['seed'] for _, round in rounds],
+                   'event_start': n_events + np.cumsum(event_counts) - event_counts,
+                   'event_count': event_counts,
+                   'keyframe_start': n_keyframes + np.cumsum(keyframe_counts) - keyframe_counts,
+                   'keyframe_count': keyframe_counts,
+                   'events': np.concatenate(events) if len(events) > 0 else np.zeros(0, np.uint16),
+                   'keyframes': np.concatenate(keyframes) if len(keyframes) > 0 else np.zeros((0, width), np.uint8),
+                   'keyframe_event': [event for _, round in rounds for event in round['keyframe_event']]}
+        for name, values in columns.items():
+            if len(values) == 0:
+                continue
+            dataset = self.file[name]
+            n = dataset.shape[0]
+            dataset.resize(n + len(values), axis=0)
+            dataset[n:] = values
+        self.file.flush()
+        self.pending = []
+
+    def close(self):
+        '''
+        Flushes pending games and closes the file, a game that was not ended is dropped
+        '''
+        if self.file.id.valid:
+            self.flush()
+            self.file.close()
+
+class _Recorder:
+    '''
+    Logs the actions of one round as they are applied and undone, see Round.recorders
+    '''
+    def __init__(self, log, recording):
+        self.log = log
+        self.recording = recording
+
+    def applied(self, round, action, seat, tile, tiles, source):
+        self.log.log_action(action, seat, tile, tiles, self.recording, source)
+
+    def undone(self, round, action, seat):
+        self.log.undo_action(self.recording)
+
+class ReplayReader:
+    '''
+    Rebuilds the boards of rounds logged by ReplayLogger
+    path: replay file
+    Rounds are numbered in the order they were logged, across every game in the file
+    '''
+    def __init__(self, path):
+        import h5py as h5
+        self.file = h5.File(path, 'r')
+        self.rounds = {name: self.file[name][:] for name in
+                       ('round_game', 'mode', 'seed', 'event_start', 'event_count',
+                        'keyframe_start', 'keyframe_count')}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.rounds['mode'])
+
+    def close(self):
+        self.file.close()
+
+    def events(self, round):
+        '''
+        Returns the actions of a round as a list of (action, seat, Tile, tiles, source) tuples,
+        the same arguments that were given to Round.apply(), source is None except for calls
+        '''
+        start, count = self.rounds['event_start'][round], self.rounds['event_count'][round]
+        actions = []
+        events = decode(self.file['events'][start:start + count])
+        for source, seat, action, id, isRed in zip(*[a.tolist() for a in events]):
+            tile = Tile.of(id, isRed)
+            if action == MELD:
+                actions[-1][3].append(tile)
+            else:
+                actions.append((ACTIONS[action], seat, tile, [], source - 1 if source > 0 else None))
+        return actions
+
+    def board(self, round, event=None):
+        '''
+        Returns the planes x 34 x 5 board of a round after event events, defaults to the end
+        The closest keyframe at or before event is unpacked and the events after it replayed
+        '''
+        mode = int(self.rounds['mode'][round])
+        count = int(self.rounds['event_count'][round])
+        event = count if event is None else event
+        if not 0 <= event <= count:
+            raise IndexError(f'round {round} has {count} events')
+
+        start = int(self.rounds['keyframe_start'][round])
+        frames = self.file['keyframe_event'][start:start + int(self.rounds['keyframe_count'][round])]
+        before = np.where(frames <= event)[0]
+        shape = (board_planes(mode), 34, 5)
+        if len(before) > 0:
+            frame = before[-1]
+            packed = self.file['keyframes'][start + frame]
+            board = np.unpackbits(packed, count=int(np.prod(shape))).astype(bool).reshape(shape)
+            done = int(frames[frame])
+        else:
+            board = _seeded_board(mode, int(self.rounds['seed'][round]))
+            done = 0
+
+        # Calls logged without their source take the tile of the last player that discarded
+        first = int(self.rounds['event_start'][round])
+        events = self.file['events'][first:first + event]
+        sources, seats, actions, ids, reds = [a.tolist() for a in decode(events)]
+        last_discard = next((seats[i] for i in range(done - 1, -1, -1) if actions[i] == 1), None)
+        for i in range(done, event):
+            seat, action, id, isRed = seats[i], actions[i], ids[i], reds[i]
+            hand, open = seat, mode + seat
+            if action == 0:
+                source, destination = 3 * mode, hand
+            elif action == 1:
+                source, destination = hand, 2 * mode + seat
+                last_discard = seat
+            elif ACTIONS[action] in _CALLS:
+                called = sources[i] - 1 if sources[i] > 0 else last_discard
+                source, destination = 2 * mode + called, open
+            else:
+                source, destination = hand, open
+            index_remove(board[source], id, isRed)
+            index_add(board[destination], id, isRed)
+        return board
+
+def _seeded_board(mode, seed):
+    '''
+    Deals the starting board of a round from its seed
+    '''
+    from Mahjong import shuffle
+    from Game import Round
+    hands, hands_index, wall, wall_index, dora_indicators, doras_index, deck = shuffle(mode, seed)
+    round = Round(mode=mode, hands=hands_index, wall=wall_index, doras=doras_index, deck=deck)
+    return round.board.copy()
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import inspect
+from pathlib import Path
+import numpy as np
+
+from Locks import locked
+'''
+Cache of precomputed lookup tables, built once and shared between processes
+- A table is saved as a .npy file named after a fingerprint of TABLE_VERSION, the source of its
+  build function, the build arguments and the values it depends on, so changing the builder
+  makes a new file. Module constants and other tables a builder reads are given as depends,
+  a table's fingerprint can be one of the depends of another
+- Next to it a .sha256 file holds the checksum of the table data. A file that is missing, or
+  that doesn't match its checksum, is rebuilt under a lock file
+- Tables are opened read only with numpy.memmap, so every process reading the same file shares
+  its pages instead of holding its own copy
+- The cache lives in cache_dir, or in the directory named by the JANJAN_TABLES environment
+  variable. If it can't be written, tables are built in memory
+'''
+
+# Bump when a table changes without its build function, arguments or depends changing
+TABLE_VERSION = 1
+
+cache_dir = Path(os.environ.get('JANJAN_TABLES', Path(__file__, '..', 'tables').resolve()))
+
+def fingerprint(name, build, args=(), depends=()):
+    '''
+    Returns a short hex fingerprint of a table, the code and arguments that build it and the
+    values it depends on
+    '''
+    source = inspect.getsource(build)
+    key = f'{TABLE_VERSION}\n{name}\n{source}\n{args!r}\n{depends!r}'.encode()
+    return hashlib.sha256(key).hexdigest()[:16]
+
+def checksum(table):
+    '''
+    Returns the sha256 hex digest of a table's data
+    '''
+    return hashlib.sha256(np.ascontiguousarray(table).data).hexdigest()
+
+def table_path(name, build, args=(), directory=None, depends=()):
+    '''
+    Returns the .npy path a table is cached at
+    '''
+    directory = cache_dir if directory is None else Path(directory)
+    return directory.joinpath(f'{name}-{fingerprint(name, build, args, depends)}.npy')
+
+def load_table(name, build, args=(), directory=None, verify=True, depends=()):
+    '''
+    Returns a table from the cache as a read only memory mapped array, building it first if
+    it is missing or does not match its checksum
+    name: name of the table, used in the file name
+    build: function that builds the table as a numpy array from args
+    verify: whether to check the checksum of a cached table before using it
+    depends: values the table depends on besides build and args, such as module constants or
+        the fingerprints of tables build reads
+    '''
+    path = table_path(name, build, args, directory, depends)
+    table = _open(path, verify)
+    if table is not None:
+        return table
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with locked(path):
+            # Another process may have built it while this one waited for the lock
+            table = _open(path, verify)
+            if table is None:
+                _save(path, build(*args))
+                table = _open(path, verify=False)
+        return table
+    except OSError:
+        return build(*args)
+
+def _open(path, verify):
+    '''
+    Opens a cached table, returns None if it is missing or its checksum doesn't match
+    '''
+    sums = path.with_suffix('.sha256')
+    if not path.exists() or not sums.exists():
+        return None
+    try:
+        table = np.load(path, mmap_mode='r')
+    except ValueError:
+        return None
+    if verify is True and checksum(table) != sums.read_text().strip():
+        return None
+    return table.view(np.ndarray)
+
+def _save(path, table):
+    '''
+    Writes a table and its checksum, through temporary files so readers never see half of one
+    '''
+    temp_path = path.with_suffix('.tmp.npy')
+    np.save(temp_path, table)
+    temp_sums = path.with_suffix('.tmp.sha256')
+    temp_sums.write_text(checksum(table))
+    os.replace(temp_sums, path.with_suffix('.sha256'))
+    os.replace(temp_path, path)
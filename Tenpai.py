@@ -1,6 +1,8 @@
+import itertools
 import numpy as np
 
 from Tile import Tile, TileIndex
+from Tables import load_table, fingerprint
 '''
 Module that contains the Tenpai class, which is used to calculate whether or not
 a hand is tenpai
@@ -11,30 +13,113 @@ class Tenpai:
     def check_tenpai(hand, open, last_draw):
         '''
         Checks for and returns all possible ways a player can discard to achieve tenpai
+        hand: 34 x 5 index of the closed hand after drawing, 3n + 2 tiles
+        open: 34 x 5 index of called tiles, chitoitsu and kokushi only count if it is empty
         Returns dict with ID of possible discards and list of ID of waits
         '''
+        counts, suits = _suits(hand)
+        isClosed = open is None or not open[:, 0].any()
+        called = None if isClosed else open[:, :4].sum(axis=1).tolist()
+
+        # Chitoitsu needs 6 pairs left after the discard, kokushi 13 orphans of 12 kinds or more
+        canChitoitsu = isClosed and 34 - counts.count(0) - counts.count(1) >= 6
+        canKokushi = (isClosed and counts.count(0) <= 22
+                      and sum(counts[i] for i in KOKUSHI_IDS) >= 13)
+        special = canChitoitsu or canKokushi
+
+        # Discard and wait touch at most two suits, every other suit must already be complete
+        incomplete = [s for s, (_, _, remainder, state, _) in enumerate(suits)
+                      if remainder == 1 or not state & (_WITH_PAIR if remainder == 2 else _SETS_ONLY)]
+        if len(incomplete) > 2 and not special:
+            return {}
+
+        # A suit of 3n tiles that is not complete can only be fixed by discarding from it
+        broken = [s for s, (_, _, remainder, state, _) in enumerate(suits)
+                  if remainder == 0 and not state & _SETS_ONLY]
+        if len(incomplete) > 2 or len(broken) > 1:
+            discard_suits = ()
+        elif len(broken) == 1:
+            discard_suits = broken
+        else:
+            discard_suits = incomplete if len(incomplete) == 2 else range(4)
+
         possible_tenpai = {}
-        # If no open hand then check possibility of Chitoitsu or Kokushi
-        if all(open[:, 0] is False):
-            # Chitoitsu
-            possible_chitoitsu = Tenpai.check_chitoitsu(hand)
-            if len(possible_chitoitsu) != 0:
-                return possible_chitoitsu
-            # Kokushi
-            possible_kokushi = Tenpai.check_kokushi(hand)
-            if len(possible_kokushi) != 0:
-                return possible_kokushi
+        tables = _suit_tables()
+        for s, (start, key, remainder, _, _) in enumerate(suits):
+            if key == 0:
+                continue
+            # The other suits are the same for every discard from this one, so which suit takes
+            # the wait is decided once per suit, see _regular_waits()
+            regular = s in discard_suits
+            others = [other for t, other in enumerate(suits) if other[2] != 0 and t != s]
+            remainder = (remainder - 1) % 3
+            if regular is True and remainder == 0:
+                # The suit has to be complete after the discard and the waits are elsewhere
+                fixed = sorted(_regular_waits(others))
+                regular = len(fixed) != 0
+            elif regular is True and remainder == 1:
+                regular = len(others) == 0
+            elif regular is True:
+                # The other suit of 3n + 2 either holds the pair or takes the wait
+                regular = len(others) == 1 and others[0][2] == 2
+                if regular is True:
+                    other_start, _, _, other_state, other_waits = others[0]
+                    other_pair = other_state & _WITH_PAIR
+                    other_waits = [other_start + p for p in _POSITIONS[other_waits & 511]]
+            if regular is False and special is False:
+                continue
 
-        number_hand, honor_hand = Tenpai.split_hand(hand)
-        
-        if Tenpai.check_early_return(number_hand, honor_hand) == True:
-            return None
+            table, waits_table = tables[s]
+            powers = _SUIT_KEYS if s < 3 else _HONOR_KEYS
+            for i, count in enumerate(counts[start:start + len(powers)]):
+                if count == 0:
+                    continue
+                discard = start + i
+                waits = ()
+                if regular is True:
+                    left = key - powers[i]
+                    if remainder == 0:
+                        waits = fixed[:] if table.item(left) & _SETS_ONLY else ()
+                    elif remainder == 1:
+                        waits = [start + p for p in _POSITIONS[waits_table.item(left) >> _PAIR_SHIFT]]
+                    else:
+                        waits = ([start + p for p in _POSITIONS[waits_table.item(left) & 511]]
+                                 if other_pair else [])
+                        if table.item(left) & _WITH_PAIR:
+                            waits = sorted(waits + other_waits)
+                if special is True:
+                    counts[discard] -= 1
+                    waits = set(waits)
+                    if canChitoitsu is True:
+                        waits |= _chitoitsu_waits(counts)
+                    if canKokushi is True:
+                        waits |= _kokushi_waits(counts)
+                    waits = sorted(waits)
+                    counts[discard] += 1
+                if called is not None:
+                    waits = [wait for wait in waits
+                             if counts[wait] + called[wait] - (wait == discard) < 4]
+                if len(waits) != 0:
+                    possible_tenpai[discard] = waits
 
-        for hand in number_hand:
-            pair_ids = np.where(hand[:, 1] == True)[0]
-            ankou_ids = np.where(hand[:, 2] == True)[0]
-            ankan_ids = np.where(hand[:, 3] == True)[0]
-            full_shuntsu, wait_shuntsu, waits = Tenpai.check_shuntsu(hand)
+        return possible_tenpai
+
+    @staticmethod
+    def check_waits(hand, open=None):
+        '''
+        Returns the sorted list of tile IDs that complete a 3n + 1 tile closed hand
+        hand: 34 x 5 index of the closed hand
+        open: 34 x 5 index of called tiles, chitoitsu and kokushi only count if it is empty
+        '''
+        counts, suits = _suits(hand)
+        isClosed = open is None or not open[:, 0].any()
+        waits = set()
+        if all(suit[2] != 0 or suit[3] & _SETS_ONLY for suit in suits):
+            waits = _regular_waits([suit for suit in suits if suit[2] != 0])
+        if isClosed is True:
+            return sorted(waits.union(_chitoitsu_waits(counts), _kokushi_waits(counts)))
+        called = open[:, :4].sum(axis=1).tolist()
+        return [wait for wait in sorted(waits) if counts[wait] + called[wait] < 4]
 
     @staticmethod
     def check_shuntsu(hand):
@@ -87,7 +172,7 @@ class Tenpai:
         kokushi_ids = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
         kokushi_index = TileIndex()
         for id in kokushi_ids:
-            kokushi_index.add(Tile(id))
+            kokushi_index.add(Tile.of(id))
         difference_index = np.subtract(hand.astype(int), kokushi_index.index.astype(int))
         waits = np.where(difference_index[:, 0] == -1)[0]
         if len(waits) == 0:
@@ -140,4 +225,451 @@ class Tenpai:
         if isolated_suit > 1 or num_gaps > 1:
             return True
         
-        return False
\ No newline at end of file
+        return False
+
+    @staticmethod
+    def shanten(hand, open=None):
+        '''
+        Returns the shanten number of a hand, the lowest of regular, chitoitsu and kokushi
+        Chitoitsu and kokushi are only considered if there is no open hand
+        -1 means the hand is complete, 0 means tenpai
+        '''
+        shanten = Tenpai.shanten_regular(hand)
+        if open is None or not open[:, 0].any():
+            shanten = min(shanten, Tenpai.shanten_chitoitsu(hand), Tenpai.shanten_kokushi(hand))
+        return shanten
+
+    @staticmethod
+    def shanten_regular(hand):
+        '''
+        Returns the shanten number of a hand for 4 sets and a pair, by looking up each suit in
+        the precomputed suit and honor tables
+        Number of sets needed is taken from the number of tiles, so called sets are left out
+        '''
+        suit_table, honor_table = _shanten_tables()
+        number_hand, honor_hand = Tenpai.split_hand(hand)
+        number_counts = number_hand[:, :, :4].sum(axis=2)
+        honor_counts = honor_hand[:, :4].sum(axis=1)
+        sets = min((int(number_counts.sum()) + int(honor_counts.sum())) // 3, 4)
+
+        # Single hands are combined in plain Python, numpy call overhead dominates otherwise
+        rows = [suit_table[key].tolist() for key in (number_counts @ _SUIT_POWERS).tolist()]
+        rows.append(honor_table[int(honor_counts @ _HONOR_POWERS)].tolist())
+        combined = rows[0]
+        for row in rows[1:]:
+            combined = _combine_lists(combined, row)
+        return combined[5 + sets] - 1
+
+    @staticmethod
+    def shanten_chitoitsu(hand):
+        '''
+        Returns the shanten number of a hand for chitoitsu, 4 of the same tile is only one pair
+        '''
+        pairs = np.count_nonzero(hand[:, 1])
+        kinds = np.count_nonzero(hand[:, 0])
+        return 6 - pairs + max(0, 7 - kinds)
+
+    @staticmethod
+    def shanten_kokushi(hand):
+        '''
+        Returns the shanten number of a hand for kokushi
+        '''
+        orphans = hand[KOKUSHI_IDS]
+        return 13 - np.count_nonzero(orphans[:, 0]) - (1 if orphans[:, 1].any() else 0)
+
+    @staticmethod
+    def shanten_counts(counts, chitoitsu=True, kokushi=True):
+        '''
+        Vectorized shanten number for tile count arrays of shape (..., 34)
+        Returns an int array of shape (...), lowest of the regular and enabled closed hand forms
+        '''
+        counts = np.asarray(counts)
+        suit_table, honor_table = _shanten_tables()
+        number_keys = counts[..., :27].reshape(counts.shape[:-1] + (3, 9)) @ _SUIT_POWERS
+        honor_keys = counts[..., 27:] @ _HONOR_POWERS
+        rows = suit_table[number_keys].astype(np.int16)
+        combined = _combine_rows(_combine_rows(rows[..., 0, :], rows[..., 1, :]), rows[..., 2, :])
+        combined = _combine_rows(combined, honor_table[honor_keys].astype(np.int16))
+
+        # Column 5 + m holds the tiles needed for m sets and a pair
+        sets = np.minimum(counts.sum(axis=-1) // 3, 4)
+        shanten = np.take_along_axis(combined, (5 + sets)[..., None], axis=-1)[..., 0] - 1
+        if chitoitsu is True:
+            pairs = np.count_nonzero(counts >= 2, axis=-1)
+            kinds = np.count_nonzero(counts >= 1, axis=-1)
+            shanten = np.minimum(shanten, 6 - pairs + np.maximum(0, 7 - kinds))
+        if kokushi is True:
+            orphans = counts[..., KOKUSHI_IDS]
+            hasPair = (orphans >= 2).any(axis=-1)
+            shanten = np.minimum(shanten, 13 - np.count_nonzero(orphans, axis=-1) - hasPair)
+        return shanten
+
+    @staticmethod
+    def ukeire_counts(counts, remaining=None, closed=True):
+        '''
+        Vectorized tile acceptance of every discard, for N hands of 3n + 2 tiles
+        counts: N x 34 tile counts
+        remaining: 34 or N x 34 counts of each tile the player has not seen, defaults to 4
+            minus the hand. See Round.unseen_counts()
+        closed: bool or bool array of N, whether chitoitsu and kokushi count
+        Every discard and every draw after it is evaluated in one shanten_counts() call
+        Returns dict of arrays with one row per hand and one column per kind of tile held,
+        padded to the most kinds in any hand:
+        discard: tile ID, -1 for padding; shanten: shanten after the discard
+        accept: bool N x kinds x 34, draws that lower shanten; types: number of accepted
+        draws; tiles: number of accepted tiles left
+        '''
+        counts = np.atleast_2d(np.asarray(counts, dtype=np.int64))
+        remaining = 4 - counts if remaining is None else np.broadcast_to(remaining, counts.shape)
+        closed = np.broadcast_to(np.asarray(closed, dtype=bool), counts.shape[:1])
+        n = len(counts)
+        kinds = max(int(np.count_nonzero(counts, axis=1).max()), 1)
+
+        # Tile IDs held first, in ID order, padding points at tiles not held
+        discards = np.argsort(counts == 0, axis=1, kind='stable')[:, :kinds]
+        held = np.take_along_axis(counts, discards, axis=1) > 0
+        after = np.repeat(counts[:, None, :], kinds, axis=1)
+        left = np.take_along_axis(counts, discards, axis=1) - 1
+        np.put_along_axis(after, discards[:, :, None], np.maximum(left, 0)[:, :, None], axis=2)
+        draws = after.astype(np.int8)[:, :, None, :] + np.eye(34, dtype=np.int8)[None, None]
+
+        # Chitoitsu and kokushi are counted for closed hands only, open hands use regular only
+        shanten = np.empty((n, kinds), dtype=np.int64)
+        drawn = np.empty((n, kinds, 34), dtype=np.int64)
+        for isClosed in (True, False):
+            rows = closed == isClosed
+            if rows.any():
+                shanten[rows] = Tenpai.shanten_counts(after[rows], isClosed, isClosed)
+                drawn[rows] = Tenpai.shanten_counts(draws[rows], isClosed, isClosed)
+
+        accept = (drawn < shanten[:, :, None]) & (after < 4) & held[:, :, None]
+        tiles = (accept * np.asarray(remaining)[:, None, :]).sum(axis=2)
+        return {'discard': np.where(held, discards, -1), 'shanten': np.where(held, shanten, -1),
+                'accept': accept, 'types': accept.sum(axis=2), 'tiles': tiles}
+
+    @staticmethod
+    def ukeire(hand, open=None, remaining=None):
+        '''
+        Tile acceptance of every discard of one hand, see ukeire_counts()
+        hand: 34 x 5 index of the closed hand, 3n + 2 tiles
+        open: 34 x 5 index of called tiles, chitoitsu and kokushi only count if it is empty
+        Returns dict of discard ID: dict with the shanten after the discard, the IDs of the
+        tiles that lower it and how many of them are left
+        '''
+        counts = hand[:, :4].sum(axis=1)
+        closed = open is None or not open[:, 0].any()
+        result = Tenpai.ukeire_counts(counts, remaining, closed)
+        return {int(id): {'shanten': int(shanten), 'accept': np.where(accept)[0].tolist(),
+                          'tiles': int(tiles)}
+                for id, shanten, accept, tiles in zip(result['discard'][0], result['shanten'][0],
+                                                      result['accept'][0], result['tiles'][0])
+                if id >= 0}
+
+    @staticmethod
+    def check_agari(hand, open=None):
+        '''
+        Returns whether a 3n + 2 tile closed hand is complete, by looking up each suit in the
+        precomputed complete suit tables
+        open: 34 x 5 index of called tiles, chitoitsu and kokushi only count if it is empty
+        '''
+        suit_table, honor_table = _agari_tables()
+        counts = hand[:, :4].sum(axis=1).tolist()
+        pairs = 0
+        for s, (a, b) in enumerate(SUIT_RANGES):
+            suit = counts[a:b]
+            remainder = sum(suit) % 3
+            if remainder == 1:
+                break
+            table, powers = (suit_table, _SUIT_KEYS) if s < 3 else (honor_table, _HONOR_KEYS)
+            key = sum(count * power for count, power in zip(suit, powers))
+            if not table[key] & (_WITH_PAIR if remainder == 2 else _SETS_ONLY):
+                break
+            pairs += remainder == 2
+        else:
+            if pairs == 1:
+                return True
+        if open is not None and open[:, 0].any():
+            return False
+        return bool(counts.count(2) == 7 or (sum(counts[i] for i in KOKUSHI_IDS) == 14
+                                             and all(counts[i] for i in KOKUSHI_IDS)))
+
+    @staticmethod
+    def check_agari_counts(counts, closed=True):
+        '''
+        Vectorized check_agari for tile count arrays of shape (..., 34)
+        closed: bool or bool array of shape (...), whether chitoitsu and kokushi count
+        Returns bool array of shape (...)
+        '''
+        counts = np.asarray(counts)
+        suit_table, honor_table = _agari_tables()
+        number_keys = counts[..., :27].reshape(counts.shape[:-1] + (3, 9)) @ _SUIT_POWERS
+        flags = np.concatenate((suit_table[number_keys],
+                                honor_table[counts[..., 27:] @ _HONOR_POWERS][..., None]), axis=-1)
+        sums = np.add.reduceat(counts, [0, 9, 18, 27], axis=-1)
+        remainders = sums % 3
+        need = np.where(remainders == 2, _WITH_PAIR, _SETS_ONLY).astype(np.uint8)
+        complete = ((flags & need) != 0) & (remainders != 1)
+        agari = complete.all(axis=-1) & (np.count_nonzero(remainders == 2, axis=-1) == 1)
+
+        chitoitsu = np.count_nonzero(counts == 2, axis=-1) == 7
+        orphans = counts[..., KOKUSHI_IDS]
+        kokushi = (orphans.all(axis=-1) & (orphans.sum(axis=-1) == 14)
+                   & (counts.sum(axis=-1) == 14))
+        return agari | (np.asarray(closed) & (chitoitsu | kokushi))
+
+    @staticmethod
+    def check_ron_all(hands, discard, opens=None):
+        '''
+        Checks whether each player's hand is complete with one discarded tile
+        hands: players x 34 x 5 indexes of the closed hands, 3n + 1 tiles each
+        discard: Tile or ID of the discarded tile
+        opens: players x 34 x 5 indexes of called tiles, or None if nobody has called
+        Returns bool array with one value per player
+        '''
+        id = discard.id if isinstance(discard, Tile) else int(discard)
+        counts = hands[:, :, :4].sum(axis=2)
+        counts[:, id] += 1
+        closed = True if opens is None else ~opens[:, :, 0].any(axis=1)
+        return Tenpai.check_agari_counts(counts, closed)
+
+
+# Shanten lookup tables
+# Each suit is keyed by its count vector read as a base 5 number. A row holds, for column
+# p * 5 + m, the fewest tiles that must be added to the suit to hold m sets and p pairs
+# Tables are built once into the cache of Tables.load_table() and memory mapped from there
+KOKUSHI_IDS = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
+_SUIT_POWERS = 5 ** np.arange(8, -1, -1)
+_HONOR_POWERS = 5 ** np.arange(6, -1, -1)
+_UNREACHABLE = 100
+_tables = None
+
+def _shanten_tables():
+    '''
+    Returns the suit and honor tables, loading them on first use
+    '''
+    global _tables
+    if _tables is None:
+        _tables = (load_table('shanten_suit', _build_table, (9, True), depends=(_UNREACHABLE, )),
+                   load_table('shanten_honor', _build_table, (7, False), depends=(_UNREACHABLE, )))
+    return _tables
+
+def _build_table(size, shuntsu):
+    '''
+    Builds the table for a suit of size tiles, with or without shuntsu allowed
+    For every target (m sets, p pairs) the complete suits are marked 0 and the distance
+    min(sum(max(target - counts, 0))) is spread out to every count vector one axis at a time
+    '''
+    sets = [np.eye(size, dtype=np.int8)[i] * 3 for i in range(size)]
+    if shuntsu is True:
+        sets += [np.eye(size, dtype=np.int8)[i:i+3].sum(axis=0) for i in range(size - 2)]
+    pairs = np.eye(size, dtype=np.int8) * 2
+
+    table = np.empty((5, ) * size + (10, ), dtype=np.uint8)
+    for m in range(5):
+        bases = np.array([sum(combo, np.zeros(size, dtype=np.int8))
+                          for combo in itertools.combinations_with_replacement(sets, m)])
+        for p in range(2):
+            targets = (bases[:, None, :] + pairs[None, :, :]).reshape(-1, size) if p else bases
+            targets = targets[(targets <= 4).all(axis=1)]
+            distance = np.full((5, ) * size, _UNREACHABLE, dtype=np.uint8)
+            distance[tuple(targets.T)] = 0
+            for axis in range(size):
+                # Tiles above the target are free to discard, missing ones cost one each
+                spread = np.moveaxis(np.minimum.accumulate(distance, axis=axis), axis, 0)
+                for v in range(3, -1, -1):
+                    np.minimum(spread[v], spread[v + 1] + 1, out=spread[v])
+                distance = np.moveaxis(spread, 0, axis)
+            table[..., p * 5 + m] = distance
+
+    return table.reshape(5 ** size, 10)
+
+# (combined column, column of first row, column of second row) for every way two rows from
+# different suits add up, sorted by combined column so they can be reduced in groups
+_COMBINE_PLAN = sorted(((p1 + p2) * 5 + m1 + m2, p1 * 5 + m1, p2 * 5 + m2)
+                       for p1, p2, m1, m2 in itertools.product(range(2), range(2), range(5), range(5))
+                       if p1 + p2 <= 1 and m1 + m2 <= 4)
+_COMBINE_COLUMNS, _COMBINE_LEFT, _COMBINE_RIGHT = (np.array(values) for values in zip(*_COMBINE_PLAN))
+_COMBINE_STARTS = np.searchsorted(_COMBINE_COLUMNS, np.arange(10))
+
+def _combine_lists(a, b):
+    '''
+    Same as _combine_rows for a single pair of rows given as lists
+    '''
+    combined = [_UNREACHABLE] * 10
+    for column, i, j in _COMBINE_PLAN:
+        total = a[i] + b[j]
+        if total < combined[column]:
+            combined[column] = total
+    return combined
+
+def _combine_rows(a, b):
+    '''
+    Min-plus combination of two table rows (or stacks of rows) from different suits
+    '''
+    total = a[..., _COMBINE_LEFT] + b[..., _COMBINE_RIGHT]
+    return np.minimum(np.minimum.reduceat(total, _COMBINE_STARTS, axis=-1), _UNREACHABLE)
+
+
+
+# Suit decompositions
+# Whether a suit can be split into sets, with or without one pair, is read from the complete
+# suit tables, and the tiles that complete it from the wait tables, both keyed by suit key
+SUIT_RANGES = ((0, 9), (9, 18), (18, 27), (27, 34))
+_SETS_ONLY = 1
+_WITH_PAIR = 2
+
+# Complete suit tables
+# Same keys as the shanten tables, each entry is a bitmask of _SETS_ONLY and _WITH_PAIR for the
+# ways the suit is complete on its own. Built by adding up every combination of sets
+_SUIT_KEYS = _SUIT_POWERS.tolist()
+_HONOR_KEYS = _HONOR_POWERS.tolist()
+_AGARI_DEPENDS = (_SETS_ONLY, _WITH_PAIR)
+_agari = None
+
+# Wait tables
+# Same keys again, bit i of an entry is set if one more tile at position i completes the suit as
+# sets only, bit _PAIR_SHIFT + i if it completes it as sets and the pair
+_PAIR_SHIFT = 9
+_POSITIONS = [[i for i in range(9) if mask >> i & 1] for mask in range(512)]
+_waits = None
+_by_suit = None
+
+# Hand @ _COUNT_WEIGHTS gives the tile counts, counts @ _KEY_MATRIX the key of each suit, then
+# its number of tiles
+_COUNT_WEIGHTS = np.array([1, 1, 1, 1, 0], dtype=np.int64)
+_KEY_MATRIX = np.zeros((34, 8), dtype=np.int64)
+for _s, (_a, _b) in enumerate(SUIT_RANGES):
+    _KEY_MATRIX[_a:_b, _s] = 5 ** np.arange(_b - _a - 1, -1, -1)
+    _KEY_MATRIX[_a:_b, 4 + _s] = 1
+
+def _agari_tables():
+    '''
+    Returns the complete suit and honor tables, loading them on first use
+    '''
+    global _agari
+    if _agari is None:
+        _agari = (load_table('agari_suit', _build_agari_table, (9, True), depends=_AGARI_DEPENDS),
+                  load_table('agari_honor', _build_agari_table, (7, False), depends=_AGARI_DEPENDS))
+    return _agari
+
+def _wait_tables():
+    '''
+    Returns the suit and honor wait tables, loading them on first use
+    '''
+    global _waits
+    if _waits is None:
+        _waits = tuple(load_table(name, _build_wait_table, args, depends=(
+                           fingerprint(agari, _build_agari_table, args, _AGARI_DEPENDS),
+                           _SETS_ONLY, _WITH_PAIR, _PAIR_SHIFT))
+                       for name, agari, args in (('waits_suit', 'agari_suit', (9, True)),
+                                                 ('waits_honor', 'agari_honor', (7, False))))
+    return _waits
+
+def build_tables():
+    '''
+    Loads every lookup table, building the ones missing from the cache
+    Returns dict of table name: table
+    '''
+    suit, honor = _shanten_tables()
+    agari_suit, agari_honor = _agari_tables()
+    waits_suit, waits_honor = _wait_tables()
+    return {'shanten_suit': suit, 'shanten_honor': honor,
+            'agari_suit': agari_suit, 'agari_honor': agari_honor,
+            'waits_suit': waits_suit, 'waits_honor': waits_honor}
+
+def _build_agari_table(size, shuntsu):
+    '''
+    Builds the complete suit table for a suit of size tiles, with or without shuntsu allowed
+    '''
+    sets = [np.eye(size, dtype=np.int8)[i] * 3 for i in range(size)]
+    if shuntsu is True:
+        sets += [np.eye(size, dtype=np.int8)[i:i+3].sum(axis=0) for i in range(size - 2)]
+    pairs = np.eye(size, dtype=np.int8) * 2
+    powers = 5 ** np.arange(size - 1, -1, -1)
+
+    table = np.zeros(5 ** size, dtype=np.uint8)
+    for m in range(5):
+        bases = np.array([sum(combo, np.zeros(size, dtype=np.int8))
+                          for combo in itertools.combinations_with_replacement(sets, m)])
+        for bit, targets in ((_SETS_ONLY, bases), 
+                             (_WITH_PAIR, (bases[:, None, :] + pairs[None, :, :]).reshape(-1, size))):
+            targets = targets[(targets <= 4).all(axis=1)]
+            table[targets @ powers] |= bit
+    return table
+
+def _build_wait_table(size, shuntsu):
+    '''
+    Builds the wait table for a suit of size tiles, with or without shuntsu allowed, by looking
+    up every count vector with one more tile in the complete suit table
+    '''
+    complete = _agari_tables()[0 if shuntsu is True else 1]
+    keys = np.arange(5 ** size)
+    table = np.zeros(5 ** size, dtype=np.uint32)
+    for i, power in enumerate((5 ** np.arange(size - 1, -1, -1)).tolist()):
+        flags = np.zeros(5 ** size, dtype=np.uint8)
+        room = keys // power % 5 < 4
+        flags[room] = complete[keys[room] + power]
+        table |= (flags & _SETS_ONLY != 0).astype(np.uint32) << i
+        table |= (flags & _WITH_PAIR != 0).astype(np.uint32) << (_PAIR_SHIFT + i)
+    return table
+
+def _suit_tables():
+    '''
+    Returns the complete suit and wait tables of each of the 4 suits, the honors last
+    '''
+    global _by_suit
+    if _by_suit is None:
+        (suit_table, honor_table), (suit_waits, honor_waits) = _agari_tables(), _wait_tables()
+        _by_suit = ((suit_table, suit_waits), ) * 3 + ((honor_table, honor_waits), )
+    return _by_suit
+
+def _suits(hand):
+    '''
+    Returns the tile count list of a hand, and for each suit a tuple of its first ID, key,
+    number of tiles modulo 3, complete suit entry and wait entry
+    '''
+    counts = hand @ _COUNT_WEIGHTS
+    keys = (counts @ _KEY_MATRIX).tolist()
+    return counts.tolist(), [(a, key, size % 3, complete.item(key), waits.item(key))
+                             for (a, _), key, size, (complete, waits)
+                             in zip(SUIT_RANGES, keys[:4], keys[4:], _suit_tables())]
+
+def _regular_waits(suits):
+    '''
+    Returns the set of tile IDs completing a 3n + 1 tile hand into sets and a pair
+    suits: the suits with a number of tiles not divisible by 3, see _suits(). Every other suit
+    has to be complete as sets only
+    '''
+    # One suit receives the wait, either a suit of 3n + 1 taking the pair, or one of two
+    # suits of 3n + 2 while the other holds the pair
+    if len(suits) == 1 and suits[0][2] == 1:
+        start, _, _, _, waits = suits[0]
+        return {start + i for i in _POSITIONS[waits >> _PAIR_SHIFT & 511]}
+    if len(suits) != 2 or suits[0][2] != 2 or suits[1][2] != 2:
+        return set()
+    waits = set()
+    for receiver, holder in (suits, suits[::-1]):
+        if holder[3] & _WITH_PAIR:
+            waits.update(receiver[0] + i for i in _POSITIONS[receiver[4] & 511])
+    return waits
+
+def _chitoitsu_waits(counts):
+    '''
+    Returns the chitoitsu wait of a 13 tile count list, 4 of the same tile is not two pairs
+    '''
+    if counts.count(2) == 6 and counts.count(1) == 1:
+        return {counts.index(1)}
+    return set()
+
+def _kokushi_waits(counts):
+    '''
+    Returns the kokushi waits of a 13 tile count list
+    '''
+    if sum(counts[i] for i in KOKUSHI_IDS) != 13 or sum(counts) != 13:
+        return set()
+    missing = [i for i in KOKUSHI_IDS if counts[i] == 0]
+    if len(missing) == 0:
+        return set(KOKUSHI_IDS)
+    if len(missing) == 1:
+        return set(missing)
+    return set()
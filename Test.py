@@ -1,12 +1,4 @@
-from dataclasses import dataclass, field
-import yaml
-import numpy as np
-import pandas as pd
-import h5py as h5
 from Tile import Tile, TileIndex
-from Player import Player
-from Game import Game
-from Action import DrawAction
 from Tenpai import Tenpai
 
 test = TileIndex()
@@ -2,11 +2,10 @@ from dataclasses import dataclass, field
 from typing import Callable
 import numpy as np
 '''
-Define Tile and TileIndex dataclasses
+Define Tile class and TileIndex dataclasses
 Tile objects store the ID of a tile, and whether it's a red tile or not
 TileIndex object store information about which tiles a certain entity has into a numpy array
 '''
-@dataclass
 class Tile:
     '''
     Class object for a mahjong tile
@@ -21,29 +20,48 @@ class Tile:
         0: Manzu; 1: Pinzu; 2: Souzu; 3: Winds; 4: Dragons
     value: value of tile, winds and dragons represented by integers
         1-4 for ESWN in order; 1-3 for Haku Hatsu Chun in order
+    Tiles are immutable, so the 34 x 2 distinct tiles are interned: Tile.of() returns the
+    shared instance instead of making a new one
     '''
-    id: int
-    isRed: bool = False
-    ranges: np.ndarray = field(default_factory=lambda: np.array([[0, 9], [9, 18], 
-                                                                 [18, 27], [27, 31], 
-                                                                 [31, 34]]), repr=False)
-    suit: int = 0
-    value: int = 0
+    __slots__ = ('id', 'isRed', 'suit', 'value')
+    ranges = np.array([[0, 9], [9, 18], [18, 27], [27, 31], [31, 34]])
+
+    def __init__(self, id, isRed=False):
+        assert id in range(34), "Tile ID must be within integer values 0-33"
+        assert isinstance(isRed, bool), "Must be a boolean"
+        object.__setattr__(self, 'id', int(id))
+        object.__setattr__(self, 'isRed', isRed)
+        object.__setattr__(self, 'suit', SUITS[id])
+        object.__setattr__(self, 'value', VALUES[id])
+
+    @staticmethod
+    def of(id, isRed=False):
+        '''
+        Returns the interned Tile with this ID and red flag
+        '''
+        return _TILES[bool(isRed)][id]
 
     def __setattr__(self, name, value):
-        if name == 'id':
-            assert value in range(34), "Tile ID must be within integer values 0-33"
-        if name == 'isRed':
-            assert isinstance(value, bool), "Must be a boolean"
-        self.__dict__[name] = value
-    
-    def __post_init__(self):
-        for i in range(len(self.ranges)):
-            a = self.ranges[i][0]
-            b = self.ranges[i][1]
-            if self.id in range(a, b):
-                object.__setattr__(self, 'suit', i)
-                object.__setattr__(self, 'value', self.id + 1 - a)
+        raise AttributeError('Tile objects are immutable, use Tile.of() for another tile')
+
+    def __eq__(self, other):
+        if not isinstance(other, Tile):
+            return NotImplemented
+        return self.id == other.id and self.isRed == other.isRed
+
+    def __hash__(self):
+        return hash((self.id, self.isRed))
+
+    def __repr__(self):
+        return f'{type(self).__name__}(id={self.id}, isRed={self.isRed})'
+
+    def __reduce__(self):
+        return (Tile.of, (self.id, self.isRed))
+
+# Suit and value of each tile ID, see Tile
+SUITS = tuple(suit for suit, (a, b) in enumerate(Tile.ranges.tolist()) for _ in range(a, b))
+VALUES = tuple(id + 1 - a for a, b in Tile.ranges.tolist() for id in range(a, b))
+_TILES = tuple(tuple(Tile(id, isRed) for id in range(34)) for isRed in (False, True))
 
 @dataclass
 class TileIndex:
@@ -51,6 +69,8 @@ class TileIndex:
     A 34 x 5 numpy array used to encode all tiles in the game
     First 4 columns are for encoding the existence of all tiles
     column 5 is for encoding whether any of the possessed tiles are red
+    Once set, the index array is only written in place, so it can be a view into a larger
+    array (see bind())
     '''
     index: np.ndarray = field(default_factory=lambda: np.full((34, 5), False, dtype=bool))
     
@@ -58,7 +78,22 @@ class TileIndex:
         assert isinstance(value, (np.ndarray)), "Index must be a numpy array"
         assert value.shape == (34, 5), "Index shape must be 34 x 5"
         assert value.dtype == 'bool', "Index must be all boolean values"
-        self.__dict__[name] = value
+        if name in self.__dict__:
+            self.__dict__[name][:] = value
+        else:
+            self.__dict__[name] = value
+
+    def bind(self, index):
+        '''
+        Copies the index into the given 34 x 5 array and uses that array from then on
+        Returns the bound array
+        '''
+        assert isinstance(index, (np.ndarray)), "Index must be a numpy array"
+        assert index.shape == (34, 5), "Index shape must be 34 x 5"
+        assert index.dtype == 'bool', "Index must be all boolean values"
+        index[:] = self.index
+        self.__dict__['index'] = index
+        return index
 
     def exist(self, tile):
         '''
@@ -187,4 +222,329 @@ class TileIndex:
         new_tiles[:, ::-1].sort()
         new_index = np.column_stack((new_tiles, new_reds))
 
-        return new_index
\ No newline at end of file
+        return new_index
+
+# Lookup arrays used to convert between counts and 34 x 5 indexes
+_COLUMNS = np.arange(4)
+_IDS = np.arange(34, dtype=np.int64)
+_BITS = np.left_shift(1, _IDS)
+
+def counts_to_index(counts, reds=0):
+    '''
+    Builds a 34 x 5 TileIndex style array from a count per tile and a red bitmask
+    counts: array of 34 ints, number of each tile possessed
+    reds: int; bit i is set if the red tile of ID i is possessed
+    '''
+    index = np.empty((34, 5), dtype=bool)
+    np.less(_COLUMNS, np.asarray(counts)[:, None], out=index[:, :4])
+    index[:, 4] = (reds >> _IDS) & 1
+    return index
+
+def index_to_counts(index):
+    '''
+    Inverse of counts_to_index, returns the counts array and the red bitmask of an index
+    '''
+    counts = index[:, :4].sum(axis=1, dtype=np.int8)
+    reds = int(np.bitwise_or.reduce(_BITS[index[:, 4]], initial=0))
+    return counts, reds
+
+def ids_to_mask(ids):
+    '''
+    Returns a 34 bit int with bit i set for every tile ID i in ids, ints are returned as is
+    '''
+    if isinstance(ids, (int, np.integer)):
+        return int(ids)
+    mask = 0
+    for id in ids:
+        mask |= 1 << int(id)
+    return mask
+
+def mask_to_ids(mask):
+    '''
+    Inverse of ids_to_mask, returns the sorted list of tile IDs in a mask
+    '''
+    return [id for id in range(34) if (mask >> id) & 1]
+
+def index_exist(index, id, isRed=False):
+    '''
+    Same as TileIndex.exist() on a bare 34 x 5 array, with the tile given by ID and red flag
+    '''
+    row = index[id]
+    if isRed is True:
+        return bool(row[4])
+    return bool(row[1] if row[4] else row[0])
+
+def index_add(index, id, isRed=False):
+    '''
+    Same as TileIndex.add() on a bare 34 x 5 array, writing to the array in place
+    '''
+    row = index[id]
+    if row[3]:
+        raise IndexError('All 4 of such tile already in index')
+    row[np.count_nonzero(row[:4])] = True
+    if isRed is True:
+        row[4] = True
+
+def index_remove(index, id, isRed=False):
+    '''
+    Same as TileIndex.remove() on a bare 34 x 5 array, writing to the array in place
+    '''
+    if not index_exist(index, id, isRed):
+        raise IndexError('target tile does not exist in index')
+    row = index[id]
+    row[np.count_nonzero(row[:4]) - 1] = False
+    if isRed is True:
+        row[4] = False
+
+@dataclass
+class CompactTileIndex:
+    '''
+    Count based drop-in for TileIndex with constant time add/remove/exist
+    counts: int8 array with the number of each of the 34 tiles possessed
+    reds: bitmask of tile IDs whose red tile is possessed
+    index: 34 x 5 array in the TileIndex layout, built on demand from counts and reds
+    '''
+    counts: np.ndarray = field(default_factory=lambda: np.zeros(34, dtype=np.int8))
+    reds: int = 0
+
+    def __post_init__(self):
+        if not isinstance(self.counts, np.ndarray) or self.counts.shape != (34, ):
+            raise ValueError('counts must be a numpy array of length 34')
+        if self.counts.dtype != np.int8:
+            self.counts = self.counts.astype(np.int8)
+
+    @property
+    def index(self):
+        return counts_to_index(self.counts, self.reds)
+
+    @index.setter
+    def index(self, index):
+        assert isinstance(index, (np.ndarray)), "Index must be a numpy array"
+        assert index.shape == (34, 5), "Index shape must be 34 x 5"
+        assert index.dtype == 'bool', "Index must be all boolean values"
+        self.counts, self.reds = index_to_counts(index)
+
+    @classmethod
+    def from_index(cls, tileindex):
+        '''
+        Creates a CompactTileIndex from a TileIndex or a 34 x 5 array
+        '''
+        index = tileindex.index if isinstance(tileindex, TileIndex) else tileindex
+        compact = cls()
+        compact.index = index
+        return compact
+
+    def to_tileindex(self):
+        '''
+        Returns the equivalent TileIndex object
+        '''
+        return TileIndex(self.index)
+
+    def exist(self, tile):
+        '''
+        Checks if tile exists in index
+        '''
+        if not isinstance(tile, Tile):
+            raise ValueError('tile must be a Tile object')
+
+        # A red tile is counted in counts, so non-red tiles need one more than the red
+        id = tile.id
+        hasRed = (self.reds >> id) & 1
+        if tile.isRed is True:
+            return bool(hasRed)
+        return bool(self.counts[id] > hasRed)
+
+    def add(self, tile):
+        '''
+        Adds a Tile object to the index
+        '''
+        if not isinstance(tile, Tile):
+            raise ValueError('tile must be a Tile object')
+
+        id = tile.id
+        if self.counts[id] == 4:
+            raise IndexError('All 4 of such tile already in index')
+        self.counts[id] += 1
+        if tile.isRed is True:
+            self.reds |= 1 << id
+
+    def remove(self, tile):
+        '''
+        Removes tile from index, if it exists
+        '''
+        if not self.exist(tile):
+            raise IndexError('target tile does not exist in index')
+
+        id = tile.id
+        self.counts[id] -= 1
+        if tile.isRed is True:
+            self.reds &= ~(1 << id)
+
+    def full_deck(self, mode):
+        '''
+        Turns index into a full deck based on game mode
+        '''
+        if mode not in (3, 4):
+            raise ValueError('not a valid game mode')
+
+        self.counts = np.full(34, 4, dtype=np.int8)
+        self.reds = (1 << 4) | (1 << 13) | (1 << 22)
+        if mode == 3:
+            self.counts[1:8] = 0
+            self.reds &= ~(1 << 4)
+
+    def clear(self):
+        '''
+        Clears the index to no tiles
+        '''
+        self.counts = np.zeros(34, dtype=np.int8)
+        self.reds = 0
+
+    def combine_index(self, tileindex):
+        '''
+        Adds a TileIndex or CompactTileIndex object into another
+        Returns the combined 34 x 5 array, same as TileIndex.combine_index()
+        '''
+        if isinstance(tileindex, CompactTileIndex):
+            counts, reds = tileindex.counts, tileindex.reds
+        else:
+            counts, reds = index_to_counts(tileindex.index)
+
+        return counts_to_index(self.counts + counts, self.reds | reds)
+
+@dataclass
+class TileIndexBatch:
+    '''
+    Many hands stored together for vectorized operations
+    counts: N x 34 int8 array with the number of each tile possessed by each hand
+    reds: N x 34 bool array, whether the red tile of each ID is possessed by each hand
+    index: N x 34 x 5 array in the TileIndex layout, built on demand
+    '''
+    counts: np.ndarray = field(default_factory=lambda: np.zeros((0, 34), dtype=np.int8))
+    reds: np.ndarray = field(default_factory=lambda: np.zeros((0, 34), dtype=bool))
+
+    def __post_init__(self):
+        if self.counts.ndim != 2 or self.counts.shape[1] != 34:
+            raise ValueError('counts shape must be N x 34')
+        if self.reds.shape != self.counts.shape:
+            raise ValueError('reds shape must match counts shape')
+        self.counts = np.ascontiguousarray(self.counts, dtype=np.int8)
+        self.reds = np.ascontiguousarray(self.reds, dtype=bool)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @classmethod
+    def empty(cls, n):
+        '''
+        Creates a batch of n empty hands
+        '''
+        return cls(np.zeros((n, 34), dtype=np.int8), np.zeros((n, 34), dtype=bool))
+
+    @classmethod
+    def from_indexes(cls, tileindexes):
+        '''
+        Creates a batch from a sequence of TileIndex/CompactTileIndex objects or 34 x 5 arrays,
+        or from a single N x 34 x 5 array
+        '''
+        if isinstance(tileindexes, np.ndarray) and tileindexes.ndim == 3:
+            index = tileindexes
+        else:
+            index = np.stack([tileindex if isinstance(tileindex, np.ndarray) else tileindex.index
+                              for tileindex in tileindexes])
+        if index.shape[1:] != (34, 5):
+            raise ValueError('index shape must be N x 34 x 5')
+        return cls(index[:, :, :4].sum(axis=2, dtype=np.int8), index[:, :, 4].copy())
+
+    def to_indexes(self, compact=False):
+        '''
+        Splits the batch back into a list of TileIndex (or CompactTileIndex) objects
+        '''
+        if compact is True:
+            reds = np.bitwise_or.reduce(np.where(self.reds, _BITS, 0), axis=1)
+            return [CompactTileIndex(counts.copy(), int(red))
+                    for counts, red in zip(self.counts, reds)]
+        return [TileIndex(index) for index in self.index]
+
+    @property
+    def index(self):
+        index = np.empty(self.counts.shape + (5, ), dtype=bool)
+        np.less(_COLUMNS, self.counts[:, :, None], out=index[:, :, :4])
+        index[:, :, 4] = self.reds
+        return index
+
+    def _rows(self, ids, rows):
+        '''
+        Broadcasts tile IDs and hand rows to matching 1D arrays
+        '''
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        ids = np.broadcast_to(np.asarray(ids), rows.shape)
+        return rows, ids
+
+    def _repeats(self, rows, ids):
+        '''
+        Returns the flat counts positions touched by rows and ids, and how many times each is
+        '''
+        return np.unique(rows * 34 + ids, return_counts=True)
+
+    def exist(self, ids, isRed=False, rows=None):
+        '''
+        Checks if tile exists in each hand
+        ids: tile ID for each hand (or one ID for all); isRed: bool or array of bools
+        rows: optional hand numbers to check, defaults to all hands
+        Returns bool array with one value per checked hand
+        '''
+        rows, ids = self._rows(ids, rows)
+        isRed = np.broadcast_to(np.asarray(isRed, dtype=bool), rows.shape)
+        hasRed = self.reds[rows, ids]
+        return np.where(isRed, hasRed, self.counts[rows, ids] > hasRed)
+
+    def add(self, ids, isRed=False, rows=None):
+        '''
+        Adds one tile to each hand (or each hand in rows)
+        '''
+        rows, ids = self._rows(ids, rows)
+        isRed = np.broadcast_to(np.asarray(isRed, dtype=bool), rows.shape)
+        tiles, repeats = self._repeats(rows, ids)
+        if (self.counts.reshape(-1)[tiles] + repeats > 4).any():
+            raise IndexError('All 4 of such tile already in index')
+        np.add.at(self.counts, (rows, ids), 1)
+        self.reds[rows[isRed], ids[isRed]] = True
+
+    def remove(self, ids, isRed=False, rows=None):
+        '''
+        Removes one tile from each hand (or each hand in rows), if it exists in all of them
+        '''
+        rows, ids = self._rows(ids, rows)
+        isRed = np.broadcast_to(np.asarray(isRed, dtype=bool), rows.shape)
+        tiles, repeats = self._repeats(rows, ids)
+        if not self.exist(ids, isRed, rows).all() or (self.counts.reshape(-1)[tiles] < repeats).any():
+            raise IndexError('target tile does not exist in index')
+        np.subtract.at(self.counts, (rows, ids), 1)
+        self.reds[rows[isRed], ids[isRed]] = False
+
+    def full_deck(self, mode):
+        '''
+        Turns every hand into a full deck based on game mode
+        '''
+        deck = CompactTileIndex()
+        deck.full_deck(mode)
+        self.counts[:] = deck.counts
+        self.reds[:] = deck.index[:, 4]
+
+    def clear(self):
+        '''
+        Clears every hand to no tiles
+        '''
+        self.counts[:] = 0
+        self.reds[:] = False
+
+    def combine_index(self, batch):
+        '''
+        Adds another TileIndexBatch (or one TileIndex for every hand) into this one
+        Returns the combined N x 34 x 5 array, same as TileIndex.combine_index() per hand
+        '''
+        if not isinstance(batch, TileIndexBatch):
+            batch = TileIndexBatch.from_indexes([batch])
+        combined = TileIndexBatch(self.counts + batch.counts, self.reds | batch.reds)
+        return combined.index
@@ -1,6 +1,359 @@
+import functools
+from dataclasses import dataclass, field
+from collections import Counter
 import numpy as np
 
 from Tile import Tile, TileIndex
-from Player import Player
-from Game import Game, Round
+'''
+Module that contains the Yaku class, which is used to score a winning hand, and the Score
+dataclass it returns
+- Melds are given as (kind, id) tuples, kind is 'chii', 'pon', 'kan' or 'closed kan' and id
+  is the lowest tile ID of the meld
+- Winds are represented by integers 0-3 for ESWN in order, seat wind 0 is the dealer
+- Decompositions of the closed hand are memoized by its count tuple in bounded LRU caches, the
+  yaku and fu that depend on the seat, round and riichi are worked out on every call
+'''
 
+@dataclass
+class Score:
+    '''
+    Class object for the score of a winning hand
+    yaku: list of (name, han) tuples, yakuman count 13 han each
+    han: total han, including dora
+    fu: fu of the hand, 0 for yakuman
+    base: basic points before the dealer and tsumo multipliers
+    transfer: score change of each seat wind, winner gains what the others pay
+    '''
+    yaku: list = field(default_factory=list)
+    han: int = 0
+    fu: int = 0
+    base: int = 0
+    transfer: np.ndarray = field(default_factory=lambda: np.zeros(4, dtype=int), repr=False)
+
+class Yaku:
+
+    @staticmethod
+    def score(hand, melds=(), win=None, tsumo=False, seat=0, round=0, riichi=False,
+              ippatsu=False, dora=0, loser=None, mode=4):
+        '''
+        Scores a winning hand
+        hand: 34 x 5 index (or 34 counts) of the closed hand, including the winning tile
+        melds: list of (kind, id) tuples for called and closed kan sets
+        win: Tile or ID of the winning tile
+        tsumo: whether the hand won by tsumo, otherwise by ron from loser
+        seat, round: seat wind of the winner and round wind
+        riichi, ippatsu: whether the winner is in riichi, and won within the first go-around
+        dora: number of dora, ura dora and red tiles in the hand, only counted with a yaku
+        loser: seat wind of the player who dealt in, for ron
+        mode: number of players, a 3 player tsumo is only paid by the 2 other players
+        Returns Score object, or None if the hand is not complete or has no yaku
+        '''
+        counts = np.asarray(hand)
+        counts = counts[:, :4].sum(axis=1) if counts.ndim == 2 else counts
+        win = win.id if isinstance(win, Tile) else int(win)
+        best = _best_score(tuple(counts.tolist()), tuple(sorted(melds)), win, bool(tsumo), seat,
+                           round, bool(riichi), bool(ippatsu))
+        if best is None:
+            return None
+
+        # Yakuman hands have no fu and don't count dora
+        yaku, han, fu = best
+        if fu != 0 and dora > 0:
+            yaku = yaku + [('dora', dora)]
+            han += dora
+        base = Yaku.base_points(han, fu, han // 13 if fu == 0 else 0)
+        return Score(yaku, han, fu, base, Yaku.transfer(base, seat, tsumo, loser, mode))
+
+    @staticmethod
+    def base_points(han, fu, yakuman=0):
+        '''
+        Returns the basic points of a hand, capped at mangan and above
+        yakuman: number of yakuman, counted 8000 each
+        '''
+        if yakuman > 0:
+            return 8000 * yakuman
+        if han >= 13:
+            return 8000
+        if han >= 11:
+            return 6000
+        if han >= 8:
+            return 4000
+        if han >= 6:
+            return 3000
+        return min(fu * 2 ** (han + 2), 2000)
+
+    @staticmethod
+    def transfer(base, seat, tsumo, loser=None, mode=4):
+        '''
+        Returns the score change of each seat wind for a win worth base points
+        Dealer ron is paid 6x base, non-dealer ron 4x base. On tsumo the dealer pays 2x base
+        and the others 1x base, or everyone pays 2x base if the dealer won
+        '''
+        transfer = np.zeros(mode, dtype=int)
+        if tsumo is True:
+            for other in range(mode):
+                if other != seat:
+                    transfer[other] = -_round_up(base * (2 if seat == 0 or other == 0 else 1))
+        else:
+            if loser is None or loser == seat:
+                raise ValueError('ron needs the seat wind of another player as loser')
+            transfer[loser] = -_round_up(base * (6 if seat == 0 else 4))
+        transfer[seat] = -transfer.sum()
+        return transfer
+
+
+# Tile groups
+DRAGONS = (31, 32, 33)
+WINDS = (27, 28, 29, 30)
+TERMINALS_HONORS = frozenset((0, 8, 9, 17, 18, 26) + WINDS + DRAGONS)
+GREENS = frozenset((19, 20, 21, 23, 25, 32))
+KOKUSHI_IDS = (0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33)
+CHUUREN = (3, 1, 1, 1, 1, 1, 1, 1, 3)
+SHUNTSU = 0
+KOUTSU = 1
+KANTSU = 2
+_MELDS = {'chii': (SHUNTSU, False), 'pon': (KOUTSU, False), 'kan': (KANTSU, False),
+          'closed kan': (KANTSU, True)}
+
+# Most count tuples kept in each decomposition cache
+CACHE_SIZE = 1 << 16
+
+def _round_up(points):
+    return -(-points // 100) * 100
+
+def _suit(id):
+    return id // 9 if id < 27 else 3
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _split_sets(counts):
+    '''
+    Returns every way a count tuple splits into sets, as tuples of (kind, id) sets
+    '''
+    i = next((i for i, count in enumerate(counts) if count != 0), None)
+    if i is None:
+        return ((), )
+    splits = ()
+    tiles = list(counts)
+    if tiles[i] >= 3:
+        tiles[i] -= 3
+        splits += tuple(((KOUTSU, i), ) + rest for rest in _split_sets(tuple(tiles)))
+        tiles[i] += 3
+    if i < 27 and i % 9 < 7 and tiles[i + 1] != 0 and tiles[i + 2] != 0:
+        tiles[i] -= 1
+        tiles[i + 1] -= 1
+        tiles[i + 2] -= 1
+        splits += tuple(((SHUNTSU, i), ) + rest for rest in _split_sets(tuple(tiles)))
+    return splits
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _decompose(counts):
+    '''
+    Returns every (pair, sets) decomposition of a 3n + 2 count tuple
+    '''
+    decompositions = ()
+    tiles = list(counts)
+    for pair in range(34):
+        if tiles[pair] >= 2:
+            tiles[pair] -= 2
+            decompositions += tuple((pair, sets) for sets in _split_sets(tuple(tiles)))
+            tiles[pair] += 2
+    return decompositions
+
+def _has_terminal(kind, id):
+    if kind == SHUNTSU:
+        return id < 27 and id % 9 in (0, 6)
+    return id in TERMINALS_HONORS
+
+def _waits(pair, sets, win):
+    '''
+    Returns every way the winning tile can complete a decomposition, as (wait, set) tuples
+    where set is the position of the completed set in sets, or None for the pair
+    sets: (kind, id) sets of the closed hand
+    '''
+    waits = [('tanki', None)] if pair == win else []
+    for i, (kind, id) in enumerate(sets):
+        if (kind, id) in sets[:i]:
+            continue
+        if kind == KOUTSU and id == win:
+            waits.append(('shanpon', i))
+        elif kind == SHUNTSU and id <= win <= id + 2:
+            if win == id + 1:
+                waits.append(('kanchan', i))
+            elif (win == id + 2 and id % 9 == 0) or (win == id and id % 9 == 6):
+                waits.append(('penchan', i))
+            else:
+                waits.append(('ryanmen', i))
+    return waits
+
+def _best_score(counts, melds, win, tsumo, seat, round, riichi, ippatsu):
+    '''
+    Returns the (yaku, han, fu) of the highest scoring way to read a hand, or None
+    '''
+    isClosed = all(kind == 'closed kan' for kind, _ in melds)
+    candidates = []
+
+    if len(melds) == 0:
+        if all(counts[i] != 0 for i in KOKUSHI_IDS) and sum(counts[i] for i in KOKUSHI_IDS) == 14:
+            candidates.append(([('kokushi musou', 13)], 0))
+        if counts.count(2) == 7:
+            candidates.append(_chitoitsu_yaku(counts, tsumo, riichi, ippatsu))
+
+    meld_sets = [(_MELDS[kind][0], id, _MELDS[kind][1]) for kind, id in melds]
+    for pair, sets in _decompose(counts):
+        for wait, completed in _waits(pair, sets, win):
+            # A set completed by ron counts as open
+            read = [(kind, id, i != completed or tsumo) for i, (kind, id) in enumerate(sets)]
+            read += meld_sets
+            candidates.append(_regular_yaku(counts, pair, read, wait, isClosed, tsumo, seat,
+                                            round, riichi, ippatsu))
+
+    best = None
+    for yaku, fu in candidates:
+        han = sum(h for _, h in yaku)
+        if han == 0:
+            continue
+        base = Yaku.base_points(han, fu, han // 13 if han >= 13 and fu == 0 else 0)
+        if best is None or (base, han) > best[0]:
+            best = ((base, han), (yaku, han, fu))
+    return None if best is None else best[1]
+
+def _chitoitsu_yaku(counts, tsumo, riichi, ippatsu):
+    '''
+    Returns the (yaku, fu) of a chitoitsu hand, fu is always 25
+    '''
+    ids = [i for i, count in enumerate(counts) if count != 0]
+    if all(i >= 27 for i in ids):
+        return [('tsuuiisou', 13)], 0
+    yaku = [('chiitoitsu', 2)]
+    yaku += _riichi_yaku(True, tsumo, riichi, ippatsu)
+    if all(i not in TERMINALS_HONORS for i in ids):
+        yaku.append(('tanyao', 1))
+    if all(i in TERMINALS_HONORS for i in ids):
+        yaku.append(('honroutou', 2))
+    yaku += _flush_yaku(ids, True)
+    return yaku, 25
+
+def _riichi_yaku(isClosed, tsumo, riichi, ippatsu):
+    yaku = []
+    if riichi is True and isClosed is True:
+        yaku.append(('riichi', 1))
+        if ippatsu is True:
+            yaku.append(('ippatsu', 1))
+    if tsumo is True and isClosed is True:
+        yaku.append(('menzen tsumo', 1))
+    return yaku
+
+def _flush_yaku(ids, isClosed):
+    '''
+    Returns honitsu or chinitsu if all number tiles are of one suit
+    '''
+    suits = set(_suit(i) for i in ids)
+    numbers = suits - {3}
+    if len(numbers) != 1:
+        return []
+    if 3 in suits:
+        return [('honitsu', 3 if isClosed else 2)]
+    return [('chinitsu', 6 if isClosed else 5)]
+
+def _regular_yaku(counts, pair, sets, wait, isClosed, tsumo, seat, round, riichi, ippatsu):
+    '''
+    Returns the (yaku, fu) of one reading of a hand of four sets and a pair
+    sets: list of (kind, id, closed) tuples
+    '''
+    triplets = [id for kind, id, _ in sets if kind != SHUNTSU]
+    shuntsu = [id for kind, id, _ in sets if kind == SHUNTSU]
+    concealed = sum(1 for kind, _, closed in sets if kind != SHUNTSU and closed is True)
+    kantsu = sum(1 for kind, _, _ in sets if kind == KANTSU)
+    ids = [pair] + [id + i for kind, id, _ in sets for i in ((0, 1, 2) if kind == SHUNTSU else (0, ))]
+    dragons = sum(1 for id in triplets if id in DRAGONS)
+    winds = sum(1 for id in triplets if id in WINDS)
+
+    # Yakuman
+    yakuman = []
+    if concealed == 4:
+        yakuman.append(('suuankou', 13))
+    if dragons == 3:
+        yakuman.append(('daisangen', 13))
+    if winds == 4:
+        yakuman.append(('daisuushii', 13))
+    elif winds == 3 and pair in WINDS:
+        yakuman.append(('shousuushii', 13))
+    if all(id >= 27 for id in ids):
+        yakuman.append(('tsuuiisou', 13))
+    if len(shuntsu) == 0 and all(id in TERMINALS_HONORS and id < 27 for id in ids):
+        yakuman.append(('chinroutou', 13))
+    if all(id in GREENS for id in ids) and all(id == 19 for id in shuntsu):
+        yakuman.append(('ryuuiisou', 13))
+    if isClosed is True and kantsu == 0:
+        suit = _suit(pair)
+        if suit < 3 and all(_suit(id) == suit for id in ids):
+            if all(c >= need for c, need in zip(counts[suit * 9:suit * 9 + 9], CHUUREN)):
+                yakuman.append(('chuuren poutou', 13))
+    if kantsu == 4:
+        yakuman.append(('suukantsu', 13))
+    if len(yakuman) != 0:
+        return yakuman, 0
+
+    # Yakuhai pair and sets
+    yakuhai = set(DRAGONS) | {27 + seat, 27 + round}
+    yaku = _riichi_yaku(isClosed, tsumo, riichi, ippatsu)
+    isPinfu = (isClosed is True and len(shuntsu) == 4 and pair not in yakuhai
+               and wait == 'ryanmen')
+    if isPinfu is True:
+        yaku.append(('pinfu', 1))
+    if all(id not in TERMINALS_HONORS for id in ids):
+        yaku.append(('tanyao', 1))
+    for id in triplets:
+        if id in DRAGONS:
+            yaku.append((('haku', 'hatsu', 'chun')[id - 31], 1))
+        if id == 27 + seat:
+            yaku.append(('seat wind', 1))
+        if id == 27 + round:
+            yaku.append(('round wind', 1))
+
+    # Sequence yaku
+    if isClosed is True:
+        peikou = sum(count // 2 for count in Counter(shuntsu).values())
+        if peikou == 2:
+            yaku.append(('ryanpeikou', 3))
+        elif peikou == 1:
+            yaku.append(('iipeikou', 1))
+    if any(v in shuntsu and v + 9 in shuntsu and v + 18 in shuntsu for v in range(7)):
+        yaku.append(('sanshoku doujun', 2 if isClosed else 1))
+    if any(s in shuntsu and s + 3 in shuntsu and s + 6 in shuntsu for s in (0, 9, 18)):
+        yaku.append(('ittsu', 2 if isClosed else 1))
+
+    # Triplet yaku
+    if any(v in triplets and v + 9 in triplets and v + 18 in triplets for v in range(9)):
+        yaku.append(('sanshoku doukou', 2))
+    if len(shuntsu) == 0:
+        yaku.append(('toitoi', 2))
+    if concealed == 3:
+        yaku.append(('sanankou', 2))
+    if kantsu == 3:
+        yaku.append(('sankantsu', 2))
+    if dragons == 2 and pair in DRAGONS:
+        yaku.append(('shousangen', 2))
+
+    # Terminal and suit yaku
+    if all(_has_terminal(kind, id) for kind, id, _ in sets) and pair in TERMINALS_HONORS:
+        if len(shuntsu) == 0:
+            yaku.append(('honroutou', 2))
+        elif any(id >= 27 for id in ids):
+            yaku.append(('chanta', 2 if isClosed else 1))
+        else:
+            yaku.append(('junchan', 3 if isClosed else 2))
+    yaku += _flush_yaku(ids, isClosed)
+
+    # Fu
+    if isPinfu is True:
+        return yaku, 20 if tsumo is True else 30
+    fu = 20 + (10 if isClosed is True and tsumo is False else 0) + (2 if tsumo is True else 0)
+    for kind, id, closed in sets:
+        if kind != SHUNTSU:
+            fu += (2 * (2 if id in TERMINALS_HONORS else 1) * (2 if closed else 1)
+                   * (4 if kind == KANTSU else 1))
+    fu += 2 * sum((pair in DRAGONS, pair == 27 + seat, pair == 27 + round))
+    fu += 2 if wait in ('kanchan', 'penchan', 'tanki') else 0
+    fu = -(-fu // 10) * 10
+    return yaku, max(fu, 30)
@@ -0,0 +1,31 @@
+import sys
+from pathlib import Path
+import numpy as np
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+from Tile import Tile, TileIndex
+from Game import Round
+from Tenpai import Tenpai
+'''
+Tests of Player.WaitTracker through the rounds that own it
+'''
+
+def index(ids):
+    tileindex = TileIndex()
+    for id in ids:
+        tileindex.add(Tile.of(id))
+    return tileindex
+
+def test_first_draw_tsumo():
+    # A tenhou: the dealer's dealt 13 tiles wait on 5p tanki, and the first draw completes them
+    hands = np.array([index([0, 1, 2, 3, 4, 5, 6, 7, 8, 27, 27, 27, 13]),
+                      index([9, 9, 9, 10, 10, 10, 11, 11, 11, 12, 12, 12, 14]),
+                      index([18, 19, 20, 18, 19, 20, 18, 19, 20, 28, 28, 28, 15]),
+                      index([29, 29, 29, 30, 30, 30, 31, 31, 31, 32, 32, 32, 16])], dtype=object)
+    round = Round(mode=4, hands=hands, wall=index([13, 21, 22]),
+                  doras=np.array([TileIndex(), TileIndex()]), deck=TileIndex())
+    round.apply('draw', 0, Tile.of(13))
+    assert Tenpai.check_agari(round.board[round.plane('hand', 0)])
+    assert round.tracker.is_winning(0, 13)
+    assert round.check_action()['tsumo'] is True
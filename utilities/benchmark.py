@@ -0,0 +1,339 @@
+import sys
+import time
+import argparse
+import subprocess
+import tracemalloc
+from pathlib import Path
+import yaml
+import numpy as np
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+from Tile import Tile, TileIndex, CompactTileIndex, TileIndexBatch
+from Tenpai import Tenpai
+from Action import DiscardAction
+from Game import Round
+from Mahjong import shuffle, deal
+from game_runner import ShantenBot, play_round
+'''
+Benchmark suite for the hot paths
+Every benchmark runs on a corpus of hands generated from a fixed seed, and reports ops/sec,
+the best of several repeats, and the blocks and bytes allocated per op
+Every run also times a fixed calibration loop, and each benchmark is scored by its ops/sec
+relative to the loop's, so scores saved on one machine can be compared on another
+Scores are compared against the baseline stored in benchmark_baseline.yml, a benchmark
+slower than the baseline by more than the tolerance fails the run, as does a missing baseline
+Run as a script: python utilities/benchmark.py [--save] [--only shuffle tenpai]
+With --imports, the modules a worker process imports are checked against an import time
+budget instead, and must not load any of the dependencies that are only needed for logging
+'''
+
+baseline_path = Path(__file__, '..', 'benchmark_baseline.yml').resolve()
+root_path = Path(__file__, '..', '..').resolve()
+
+# Import time budget
+# Milliseconds each module may take to import on top of numpy, in a fresh interpreter
+IMPORT_BUDGETS = {'Tile': 50, 'Tenpai': 50, 'Action': 50, 'Player': 50, 'Yaku': 50, 'Dora': 50,
+                  'Mahjong': 50, 'Game': 100, 'Advisor': 150}
+LAZY_MODULES = ('h5py', 'yaml', 'pandas')
+
+def corpus(n=512, mode=4, seed=0):
+    '''
+    Returns n hands of 14 tiles as lists of Tile objects, dealt from seed
+    '''
+    ids, reds = deal(n, mode, seed)
+    return [[Tile.of(id, red) for id, red in zip(row[:14].tolist(), red_row[:14].tolist())]
+            for row, red_row in zip(ids, reds)]
+
+def _indexes(hands):
+    indexes = []
+    for hand in hands:
+        index = TileIndex()
+        for tile in hand:
+            index.add(tile)
+        indexes.append(index)
+    return indexes
+
+# Benchmarks
+# Each one takes the corpus and returns a function that runs a number of ops, and that number
+def bench_tileindex_add_remove(hands):
+    def run():
+        for hand in hands:
+            index = TileIndex()
+            for tile in hand:
+                index.add(tile)
+            for tile in hand:
+                index.remove(tile)
+    return run, 2 * sum(len(hand) for hand in hands)
+
+def bench_tileindex_exist(hands):
+    indexes = _indexes(hands)
+    probes = [Tile.of(id) for id in range(34)]
+    def run():
+        for index in indexes:
+            for tile in probes:
+                index.exist(tile)
+    return run, len(indexes) * len(probes)
+
+def bench_tileindex_combine(hands):
+    indexes = _indexes(hands)
+    pairs = list(zip(indexes[::2], indexes[1::2]))
+    def run():
+        for a, b in pairs:
+            a.combine_index(b)
+    return run, len(pairs)
+
+def _compacts(hands):
+    return [CompactTileIndex.from_index(index) for index in _indexes(hands)]
+
+def bench_compact_add_remove(hands):
+    def run():
+        for hand in hands:
+            index = CompactTileIndex()
+            for tile in hand:
+                index.add(tile)
+            for tile in hand:
+                index.remove(tile)
+    return run, 2 * sum(len(hand) for hand in hands)
+
+def bench_compact_exist(hands):
+    indexes = _compacts(hands)
+    probes = [Tile.of(id) for id in range(34)]
+    def run():
+        for index in indexes:
+            for tile in probes:
+                index.exist(tile)
+    return run, len(indexes) * len(probes)
+
+def bench_batch_add_remove(hands):
+    # One op is one tile of one hand, each call adds or removes a tile in every hand
+    ids = np.array([[tile.id for tile in hand] for hand in hands]).T
+    reds = np.array([[tile.isRed for tile in hand] for hand in hands]).T
+    batch = TileIndexBatch.empty(len(hands))
+    def run():
+        for column, red in zip(ids, reds):
+            batch.add(column, red)
+        for column, red in zip(ids, reds):
+            batch.remove(column, red)
+    return run, 2 * len(ids) * len(hands)
+
+def bench_batch_exist(hands):
+    batch = TileIndexBatch.from_indexes(_indexes(hands))
+    def run():
+        for id in range(34):
+            batch.exist(id)
+    return run, 34 * len(batch)
+
+def bench_shuffle(hands):
+    def run():
+        for seed in range(64):
+            shuffle(4, seed)
+    return run, 64
+
+def bench_deal(hands):
+    def run():
+        deal(1024, 4, 0)
+    return run, 1024
+
+def bench_chitoitsu(hands):
+    indexes = [index.index for index in _indexes(hands)]
+    def run():
+        for index in indexes:
+            Tenpai.check_chitoitsu(index)
+    return run, len(indexes)
+
+def bench_kokushi(hands):
+    indexes = [index.index for index in _indexes(hands)]
+    def run():
+        for index in indexes:
+            Tenpai.check_kokushi(index)
+    return run, len(indexes)
+
+def bench_tenpai(hands):
+    indexes = [index.index for index in _indexes(hands)]
+    open = np.zeros((34, 5), dtype=bool)
+    draws = [hand[-1] for hand in hands]
+    def run():
+        for index, draw in zip(indexes, draws):
+            Tenpai.check_tenpai(index, open, draw)
+    return run, len(indexes)
+
+def bench_ukeire(hands):
+    counts = np.stack([index.index[:, :4].sum(axis=1) for index in _indexes(hands)])
+    def run():
+        Tenpai.ukeire_counts(counts)
+    return run, len(counts)
+
+def bench_chii_pon_kan(hands):
+    indexes = [index.index for index in _indexes([hand[:13] for hand in hands])]
+    discards = [hand[13] for hand in hands]
+    def run():
+        for index, discard in zip(indexes, discards):
+            DiscardAction.check_chii(index, discard)
+            DiscardAction.check_pon_kan(index, discard)
+    return run, len(indexes)
+
+def bench_round(hands):
+    rng = np.random.default_rng(0)
+    policies = [ShantenBot(rng) for _ in range(4)]
+    def run():
+        for seed in range(8):
+            hand_tiles, hands_index, wall, wall_index, dora_indicators, doras_index, deck = shuffle(4, seed)
+            round = Round(mode=4, hands=hands_index, wall=wall_index, doras=doras_index, deck=deck)
+            play_round(round, wall, policies, 0)
+    return run, 8
+
+BENCHMARKS = {'tileindex add/remove': bench_tileindex_add_remove,
+              'tileindex exist': bench_tileindex_exist,
+              'tileindex combine': bench_tileindex_combine,
+              'compact add/remove': bench_compact_add_remove,
+              'compact exist': bench_compact_exist,
+              'batch add/remove': bench_batch_add_remove,
+              'batch exist': bench_batch_exist,
+              'shuffle': bench_shuffle,
+              'deal': bench_deal,
+              'chitoitsu': bench_chitoitsu,
+              'kokushi': bench_kokushi,
+              'tenpai': bench_tenpai,
+              'ukeire': bench_ukeire,
+              'chii/pon/kan': bench_chii_pon_kan,
+              'round': bench_round}
+
+def calibration(hands):
+    '''
+    Fixed mix of interpreter and small numpy work that every score is relative to, it does not
+    depend on the repository code, so only the speed of the machine changes it
+    '''
+    counts = np.zeros(34, dtype=np.int8)
+    def run():
+        total = 0
+        for i in range(20000):
+            total += i * i % 7
+            counts[i % 34] = total & 3
+    return run, 20000
+
+def measure(benchmark, hands, repeat=5):
+    '''
+    Runs a benchmark repeat times after a warm-up run, each run right after one of the
+    calibration loop so both see the machine in the same state
+    Returns dict with the ops/sec of the best run, its score, the median over the runs of the
+    ops/sec relative to the calibration run before it, and the blocks and bytes allocated per op while running it under
+    tracemalloc, counting blocks still alive at the end of the run
+    '''
+    run, ops = benchmark(hands)
+    reference, reference_ops = calibration(hands)
+    run()
+    times = [(_timed(reference), _timed(run)) for _ in range(repeat)]
+    best = min(seconds for _, seconds in times)
+    score = float(np.median([ops / seconds / (reference_ops / before) for before, seconds in times]))
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'lineno'))
+    return {'ops/sec': ops / best, 'score': score, 'blocks/op': blocks / ops,
+            'peak bytes/op': peak / ops}
+
+def _timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+def import_time(module, repeat=5):
+    '''
+    Returns the best of repeat fresh imports of module in milliseconds, after numpy is imported,
+    and the lazy modules it loaded
+    '''
+    script = ('import sys, time; import numpy; start = time.perf_counter(); '
+              f'import {module}; print((time.perf_counter() - start) * 1000); '
+              f'print(*[name for name in {LAZY_MODULES!r} if name in sys.modules])')
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=root_path, check=True,
+                                capture_output=True, text=True).stdout.splitlines()
+        times.append(float(output[0]))
+    loaded = output[1].split() if len(output) > 1 else []
+    return min(times), loaded
+
+def check_imports(budgets=IMPORT_BUDGETS):
+    '''
+    Prints the import time of each module, returns the modules over budget or loading a lazy module
+    '''
+    failed = []
+    for module, budget in budgets.items():
+        milliseconds, loaded = import_time(module)
+        print(f'{module:22} {milliseconds:8.1f} ms (budget {budget} ms) '
+              f'{"loads " + ", ".join(loaded) if loaded else ""}')
+        if milliseconds > budget or len(loaded) > 0:
+            failed.append(module)
+    return failed
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns the names of benchmarks whose score dropped below the baseline by more than tolerance
+    '''
+    return [name for name, result in results.items()
+            if name in baseline and result['score'] < baseline[name]['score'] * (1 - tolerance)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the hot paths')
+    parser.add_argument('--only', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--hands', type=int, default=512)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--imports', action='store_true', help='check import times instead')
+    args = parser.parse_args()
+
+    if args.imports:
+        failed = check_imports()
+        if len(failed) > 0:
+            print(f'REGRESSION: {", ".join(failed)} over import budget or loading {", ".join(LAZY_MODULES)}')
+            sys.exit(1)
+        return
+
+    hands = corpus(args.hands, seed=args.seed)
+    baseline = {}
+    if baseline_path.exists():
+        with open(baseline_path, "r") as baselinefile:
+            baseline = yaml.safe_load(baselinefile) or {}
+    elif args.save is False:
+        print(f'REGRESSION: no baseline at {baseline_path}, run with --save to store one')
+        sys.exit(1)
+
+    results = {}
+    for name in args.only:
+        results[name] = measure(BENCHMARKS[name], hands, args.repeat)
+        result = results[name]
+        change = ''
+        if name in baseline:
+            change = f' ({result["score"] / baseline[name]["score"] - 1:+.1%} vs baseline)'
+        print(f'{name:22} {result["ops/sec"]:12.1f} ops/sec {result["score"]:10.4g} score{change:24} '
+              f'{result["blocks/op"]:8.2f} blocks/op {result["peak bytes/op"]:10.1f} peak bytes/op')
+
+    missing = [name for name in results if name not in baseline]
+    if args.save is False and len(missing) > 0:
+        print(f'REGRESSION: {", ".join(missing)} not in baseline, run with --save to add them')
+        sys.exit(1)
+
+    if args.save:
+        baseline.update({name: {key: float(f'{value:.4g}') for key, value in result.items()
+                                if key != 'ops/sec'}
+                         for name, result in results.items()})
+        with open(baseline_path, "w") as baselinefile:
+            yaml.safe_dump(baseline, baselinefile, sort_keys=False)
+        print(f'saved baseline to {baseline_path}')
+        return
+
+    slower = compare(results, baseline, args.tolerance)
+    if len(slower) > 0:
+        print(f'REGRESSION: {", ".join(slower)} slower than baseline by more than {args.tolerance:.0%}')
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
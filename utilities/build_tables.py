@@ -0,0 +1,35 @@
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+import Tables
+'''
+Builds the lookup tables of Tenpai into the table cache, so worker processes only map them
+Run as a script: python utilities/build_tables.py [--dir path] [--rebuild]
+'''
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the cached lookup tables')
+    parser.add_argument('--dir', type=str, default=None, help='cache directory, see Tables.cache_dir')
+    parser.add_argument('--rebuild', action='store_true', help='remove cached tables first')
+    args = parser.parse_args()
+
+    if args.dir is not None:
+        Tables.cache_dir = Path(args.dir).resolve()
+    if args.rebuild is True:
+        for path in Tables.cache_dir.glob('*.npy'):
+            path.unlink()
+            path.with_suffix('.sha256').unlink(missing_ok=True)
+
+    from Tenpai import build_tables
+    start = time.perf_counter()
+    tables = build_tables()
+    for name, table in tables.items():
+        print(f'{name:14} {str(table.shape):14} {table.nbytes / 1e6:8.2f} MB {Tables.checksum(table)}')
+    print(f'{time.perf_counter() - start:.2f} seconds, cached in {Tables.cache_dir}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import sys
+import time
+import argparse
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+import numpy as np
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+from Tile import Tile
+from Game import Game
+from Tenpai import Tenpai
+from Dora import DoraIndex
+from Logger import GameLogger
+from Replay import ReplayLogger
+from Profiler import PhaseTimer, phase
+'''
+Headless self-play runner
+Plays full games between bot policies with no input, spread over a process pool where each
+worker gets its own seed derived from one root seed
+Run as a script: python utilities/game_runner.py --games 1000 --mode 4 --bots shanten
+With --log, every worker logs the gameboard after each discard to its own '{log} {worker}.h5'
+With --replay as well, the actions of each round are logged instead, see Replay.ReplayLogger
+With --profile N, one in N calls of each phase is timed and the phase times are printed
+'''
+
+# Bot policies
+# A policy gets the 34 x 5 index of its hand after drawing and returns the tile ID to discard
+class RandomBot:
+    '''
+    Discards a random tile from its hand
+    '''
+    def __init__(self, rng=None):
+        self.rng = np.random.default_rng(rng)
+
+    def discard(self, hand, round, seat):
+        return int(self.rng.choice(np.where(hand[:, 0])[0]))
+
+class TsumogiriBot:
+    '''
+    Always discards the tile it just drew
+    '''
+    def __init__(self, rng=None):
+        pass
+
+    def discard(self, hand, round, seat):
+        return round.last_draw.id
+
+class ShantenBot:
+    '''
+    Discards the tile that leaves the lowest shanten number, ties broken at random
+    '''
+    def __init__(self, rng=None):
+        self.rng = np.random.default_rng(rng)
+
+    def discard(self, hand, round, seat):
+        counts = hand[:, :4].sum(axis=1)
+        candidates = np.where(counts)[0]
+        after = np.repeat(counts[None, :], len(candidates), axis=0)
+        after[np.arange(len(candidates)), candidates] -= 1
+        shanten = Tenpai.shanten_counts(after)
+        return int(self.rng.choice(candidates[shanten == shanten.min()]))
+
+BOTS = {'random': RandomBot, 'tsumogiri': TsumogiriBot, 'shanten': ShantenBot}
+
+def round_steps(round, wall, dealer, game=None, dora=None):
+    '''
+    Generator that plays out a dealt round until someone wins or the wall runs out
+    Yields (round, seat) whenever seat has to discard, and is sent the tile ID to discard
+    round: Round object built from shuffle()
+    wall: array of Tile objects in draw order, from shuffle()
+    dealer: seat that draws first
+    game: Game object to log the gameboard to after every discard, if it is logging
+    dora: DoraIndex used to score wins, see Round.score()
+    Returns dict with the result ('tsumo', 'ron' or 'draw'), winner seat, loser seat,
+    number of turns played, the seats in tenpai at a draw and the Score of a win
+    A hand without yaku does not win
+    '''
+    mode = round.mode
+    tracker = round.tracker
+
+    for turn, tile in enumerate(wall):
+        seat = (dealer + turn) % mode
+        hand = round.hands[seat]
+        round.apply('draw', seat, tile)
+        if tracker.is_winning(seat, tile.id):
+            score = round.score(seat, tile, dealer=dealer, dora=dora)
+            if score is not None:
+                return {'result': 'tsumo', 'winner': seat, 'loser': None, 'turns': turn + 1,
+                        'tenpai': [], 'score': score}
+
+        # Discard the plain copy of the chosen tile when there is one, so red fives are kept
+        id = yield round, seat
+        discard = Tile.of(id, False)
+        if not hand.exist(discard):
+            discard = Tile.of(id, True)
+        round.apply('discard', seat, discard)
+        if game is not None:
+            game.log_board(round.gameboard)
+
+        # Only the discarding player's waits change, furiten players can't ron
+        for i in range(1, mode):
+            other = (seat + i) % mode
+            if tracker.can_ron(other, id):
+                score = round.score(other, discard, seat, dealer, dora)
+                if score is not None:
+                    return {'result': 'ron', 'winner': other, 'loser': seat, 'turns': turn + 1,
+                            'tenpai': [], 'score': score}
+
+    tenpai = [seat for seat in range(mode) if tracker.is_tenpai(seat)]
+    return {'result': 'draw', 'winner': None, 'loser': None, 'turns': len(wall),
+            'tenpai': tenpai, 'score': None}
+
+def play_round(round, wall, policies, dealer, game=None, dora=None):
+    '''
+    Plays out a dealt round with one policy per seat, see round_steps()
+    '''
+    return drive(round_steps(round, wall, dealer, game, dora), policies)
+
+def game_steps(mode, rng, log=None, timer=None, names=None):
+    '''
+    Generator that plays an East-only game, the dealer keeps the deal on a win or a draw in
+    tenpai. Yields and is sent the same as round_steps()
+    log: GameLogger, ReplayLogger or None; logs the game if given
+    timer: PhaseTimer or None; times the phases of the game if given
+    names: list of player names, defaults to those of Game
+    Returns list of round results, see round_steps(), and the final standing
+    '''
+    game = Game(mode=mode, names=names, doLogging=log is not None, log=log, timer=timer)
+    results = []
+    while game.isOver is False:
+        dealer = (game.round - 1) % mode
+        round, wall, dora_indicators = game.start_round(rng)
+        # Nobody calls kan, so only the first indicator is ever revealed
+        dora = DoraIndex.from_indicators(dora_indicators[0][:1], mode=mode)
+        result = yield from round_steps(round, wall, dealer, game, dora)
+        results.append(result)
+        if result['score'] is not None:
+            for name, points in zip(game.names, result['score'].transfer):
+                game.standing[name] += int(points)
+        if result['winner'] == dealer or dealer in result['tenpai']:
+            game.repeat += 1
+        else:
+            game.round += 1
+            game.repeat = 0
+            if game.round > mode:
+                game.end()
+
+    return results, game.standing
+
+def play_game(mode, policies, rng, log=None, timer=None):
+    '''
+    Plays an East-only game with one policy per seat, see game_steps()
+    '''
+    return drive(game_steps(mode, rng, log, timer), policies)
+
+def drive(steps, policies):
+    '''
+    Runs a round_steps() or game_steps() generator, asking policies for every discard
+    Returns what the generator returns
+    '''
+    try:
+        round, seat = next(steps)
+        while True:
+            round, seat = steps.send(policies[seat].discard(round.hands[seat].index, round, seat))
+    except StopIteration as stop:
+        return stop.value
+
+def _worker(args):
+    '''
+    Plays a share of the games in one process and returns its aggregate counts and PhaseTimer
+    '''
+    mode, bots, seed, games, log, replay, profile = args
+    rng = np.random.default_rng(seed)
+    policies = [BOTS[bot](rng) for bot in bots]
+    if log is not None:
+        log = ReplayLogger(log) if replay is True else GameLogger(log)
+    timer = PhaseTimer(profile) if profile > 0 else None
+    stats = Counter()
+    for _ in range(games):
+        stats['games'] += 1
+        results, standing = play_game(mode, policies, rng, log, timer)
+        for result in results:
+            stats['rounds'] += 1
+            stats['turns'] += result['turns']
+            stats[result['result']] += 1
+            if result['winner'] is not None:
+                stats[f'P{result["winner"] + 1} wins'] += 1
+                stats['han'] += result['score'].han
+        for name, points in standing.items():
+            stats[f'{name} points'] += points
+    if log is not None:
+        with phase(timer, 'log flush'):
+            log.close()
+    return stats, timer
+
+def run(games, mode=4, bots=('shanten', ), seed=None, processes=None, log=None, replay=False,
+        profile=0):
+    '''
+    Plays games spread over a process pool
+    games: int; total number of games
+    bots: names of the policies in BOTS, one per seat or one for every seat
+    seed: int or None; root seed, every worker gets an independent child seed
+    processes: int or None; number of worker processes, defaults to all cores
+    log: str or None; if given, worker i logs its games to the file '{log} {i}.h5'
+    replay: bool; log the actions of each round instead of gameboards
+    profile: int; time one in profile calls of each phase, 0 for no timing
+    Returns dict with aggregate results, elapsed seconds and rounds per second, and the
+    PhaseTimer of all workers or None
+    '''
+    if len(bots) == 1:
+        bots = tuple(bots) * mode
+    if len(bots) != mode:
+        raise ValueError('need one bot per player or one bot for every player')
+    processes = processes or cpu_count()
+    shares = [games // processes + (i < games % processes) for i in range(processes)]
+    seeds = np.random.SeedSequence(seed).spawn(processes)
+    logs = [None if log is None else f'{log} {i}.h5' for i in range(processes)]
+    jobs = [(mode, bots, seed, share, log, replay, profile)
+            for seed, share, log in zip(seeds, shares, logs) if share > 0]
+
+    start = time.perf_counter()
+    stats = Counter()
+    timer = PhaseTimer(profile) if profile > 0 else None
+    with Pool(processes) as pool:
+        for worker_stats, worker_timer in pool.imap_unordered(_worker, jobs):
+            stats.update(worker_stats)
+            if timer is not None:
+                timer.merge(worker_timer)
+    seconds = time.perf_counter() - start
+
+    stats = dict(stats)
+    stats.update({'seconds': seconds, 'rounds/sec': stats.get('rounds', 0) / seconds})
+    return stats, timer
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless self-play between bots')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--mode', type=int, default=4, choices=(3, 4))
+    parser.add_argument('--bots', nargs='+', default=['shanten'], choices=list(BOTS))
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--log', type=str, default=None)
+    parser.add_argument('--replay', action='store_true', help='log actions instead of gameboards')
+    parser.add_argument('--profile', type=int, default=0, help='time one in N calls of each phase')
+    parser.add_argument('--profile-out', type=str, default=None, help='yaml file for the phase times')
+    args = parser.parse_args()
+
+    stats, timer = run(args.games, args.mode, args.bots, args.seed, args.processes, args.log,
+                       args.replay, args.profile)
+    for key, value in stats.items():
+        print(f'{key}: {value:.2f}' if isinstance(value, float) else f'{key}: {value}')
+    if timer is not None:
+        for name, times in timer.stats().items():
+            print(f'{name:12} {times["calls"]:10} calls {times["mean ms"]:9.4f} ms/call '
+                  f'{times["seconds"]:9.3f} s (summed over workers)')
+        if args.profile_out is not None:
+            timer.export(args.profile_out)
+
+if __name__ == "__main__":
+    main()
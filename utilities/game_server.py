@@ -0,0 +1,238 @@
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from pathlib import Path
+import numpy as np
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+from Tile import ids_to_mask
+from game_runner import game_steps
+'''
+Asyncio game server that hosts many tables of bot matches at once
+Clients connect over local TCP or a Unix socket and speak newline delimited JSON:
+- client: {"type": "join", "name": str}, server: {"type": "welcome", "name": str}
+- Once mode clients wait in the lobby they are seated at a new table, every table plays an
+  East-only game as in game_runner.game_steps()
+- server: {"type": "observe", "table", "seat", "turn", "timeout", "draw", "hand", "reds",
+  "opens", "discards", "wall"}; hand, opens and discards are 34 tile counts (opens and
+  discards one list per seat), reds a bitmask of the tile IDs held as red, wall the tiles left
+- client: {"type": "action", "turn": int, "tile": int}; the tile ID to discard
+- server: {"type": "end", "table", "standing", "rounds"} when the game is over; standing is
+  null if the table stopped on an error, which is logged
+A missing, late or invalid action discards the drawn tile. Each table runs as its own task and
+each connection reads in its own task, so a slow client only holds up its own table
+Run as a script: python utilities/game_server.py --port 8765 (or --unix path), then connect
+clients, see stub_client.py
+'''
+
+logger = logging.getLogger(__name__)
+
+class Connection:
+    '''
+    One client connection, incoming messages are read in the background into inbox
+    '''
+    def __init__(self, reader, writer, name):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.closed = False
+        self.inbox = asyncio.Queue()
+        self.listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if len(line) == 0:
+                    break
+                try:
+                    await self.inbox.put(json.loads(line))
+                except ValueError:
+                    continue
+        except ConnectionError:
+            pass
+        finally:
+            self.closed = True
+            await self.inbox.put(None)
+
+    async def send(self, message, timeout=None):
+        '''
+        Sends one message, a client that doesn't take it within timeout is treated as gone
+        '''
+        if self.closed is True:
+            return
+        try:
+            self.writer.write((json.dumps(message) + '\n').encode())
+            await asyncio.wait_for(self.writer.drain(), timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            self.closed = True
+
+    async def ask(self, message, timeout):
+        '''
+        Sends a message with a turn number and waits up to timeout seconds for the reply with
+        the same turn, stale replies to earlier turns are dropped
+        Returns the reply, or None if it did not come in time
+        '''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        await self.send(message, timeout)
+        while self.closed is False:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                reply = await asyncio.wait_for(self.inbox.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if reply is None:
+                return None
+            if reply.get('type') == 'action' and reply.get('turn') == message['turn']:
+                return reply
+        return None
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+def observe(round, seat):
+    '''
+    Returns what a player sees of the board when they have to discard
+    '''
+    board = round.board
+    counts = lambda plane: board[plane, :, :4].sum(axis=-1).tolist()
+    mode = round.mode
+    return {'draw': round.last_draw.id,
+            'hand': counts(round.plane('hand', seat)),
+            'reds': ids_to_mask(np.where(board[round.plane('hand', seat), :, 4])[0]),
+            'opens': counts(slice(mode, 2 * mode)),
+            'discards': counts(slice(2 * mode, 3 * mode)),
+            'wall': int(board[round.plane('wall'), :, :4].sum())}
+
+class GameServer:
+    '''
+    Seats connecting clients at tables and plays their games
+    mode: number of players per table
+    timeout: seconds a client has to answer each turn
+    seed: int or None; root seed, every table gets an independent child seed
+    stats: counts of games played, games stopped by an error, turns asked and turns that fell
+        back to the drawn tile
+    '''
+    def __init__(self, mode=4, timeout=1.0, seed=None):
+        self.mode = mode
+        self.timeout = timeout
+        self.seeds = np.random.SeedSequence(seed)
+        self.lobby = []
+        self.tables = {}
+        self.next_table = 0
+        self.stats = Counter()
+
+    async def handle(self, reader, writer):
+        '''
+        Handles one client from joining until it disconnects
+        '''
+        try:
+            join = json.loads(await reader.readline())
+        except ValueError:
+            writer.close()
+            return
+        name = str(join.get('name', f'client {self.stats["clients"]}'))
+        self.stats['clients'] += 1
+        connection = Connection(reader, writer, name)
+        await connection.send({'type': 'welcome', 'name': name})
+        self.lobby.append(connection)
+        self._seat()
+        await connection.listener
+        if connection in self.lobby:
+            self.lobby.remove(connection)
+        await connection.close()
+
+    def _seat(self):
+        '''
+        Starts a table for every mode connected clients waiting in the lobby
+        '''
+        self.lobby = [connection for connection in self.lobby if connection.closed is False]
+        while len(self.lobby) >= self.mode:
+            players, self.lobby = self.lobby[:self.mode], self.lobby[self.mode:]
+            table = self.next_table
+            self.next_table += 1
+            self.tables[table] = asyncio.create_task(self.play_table(table, players))
+
+    async def play_table(self, table, players):
+        '''
+        Plays one game between the players of a table
+        However the game stops, the table is removed and its players are sent the end message
+        Returns the final standing, None if the game stopped on an error
+        '''
+        results, standing = [], None
+        turn = 0
+        try:
+            rng = np.random.default_rng(self.seeds.spawn(1)[0])
+            names = [player.name for player in players]
+            if len(set(names)) != len(names):
+                names = [f'{name} {seat + 1}' for seat, name in enumerate(names)]
+            steps = game_steps(self.mode, rng, names=names)
+            round, seat = next(steps)
+            while True:
+                turn += 1
+                self.stats['turns'] += 1
+                message = {'type': 'observe', 'table': table, 'seat': seat, 'turn': turn,
+                           'timeout': self.timeout, **observe(round, seat)}
+                reply = await players[seat].ask(message, self.timeout)
+                id = None if reply is None else reply.get('tile')
+                if not isinstance(id, int) or not 0 <= id < 34 or not round.hands[seat].index[id, 0]:
+                    id = round.last_draw.id
+                    self.stats['defaulted'] += 1
+                round, seat = steps.send(id)
+        except StopIteration as stop:
+            results, standing = stop.value
+            self.stats['games'] += 1
+        except Exception:
+            logger.exception(f'table {table} stopped at turn {turn}')
+            self.stats['failed'] += 1
+        finally:
+            self.tables.pop(table, None)
+            for player in players:
+                await player.send({'type': 'end', 'table': table, 'standing': standing,
+                                   'rounds': len(results)}, self.timeout)
+        return standing
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        '''
+        Starts listening on a TCP port, or on a Unix socket if path is given
+        Returns the asyncio server
+        '''
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path)
+        return await asyncio.start_server(self.handle, host, port)
+
+async def _main(args):
+    server = GameServer(args.mode, args.timeout, args.seed)
+    listener = await server.serve(args.host, args.port, args.unix)
+    where = args.unix if args.unix is not None else f'{args.host}:{args.port}'
+    print(f'serving {args.mode} player tables on {where}')
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-table game server for bot matches')
+    parser.add_argument('--mode', type=int, default=4, choices=(3, 4))
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', type=str, default=None, help='Unix socket path instead of TCP')
+    parser.add_argument('--timeout', type=float, default=1.0, help='seconds per turn')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
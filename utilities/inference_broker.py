@@ -0,0 +1,202 @@
+import sys
+import time
+import asyncio
+import argparse
+from collections import Counter
+from pathlib import Path
+import numpy as np
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+from game_runner import game_steps
+'''
+Batched policy inference shared by many concurrently running tables
+Tables ask the broker for each discard with the board as their player sees it. The broker
+stacks the pending requests into one batch and calls the policy once, flushing when max_batch
+requests are waiting, when every connected table is waiting, or max_latency seconds after the
+first request of the batch
+A policy is any function policy(boards, legal) -> actions:
+boards: batch x planes x 34 x 5 bool, see view(); legal: batch x 34 bool tiles that can be
+discarded; actions: batch tile IDs
+Run as a script to benchmark the broker offline with DummyPolicy:
+python utilities/inference_broker.py --tables 64 --max-batch 64
+'''
+
+def view(round, seat):
+    '''
+    Returns the board a player sees and the tiles they can discard
+    Planes are the player's hand, then every open and every discard in seat order starting
+    from the player, so the player is always first. Other hands, the wall and the dora
+    planes are hidden
+    '''
+    mode = round.mode
+    order = (seat + np.arange(mode)) % mode
+    planes = np.concatenate(([seat], mode + order, 2 * mode + order))
+    board = round.board[planes]
+    return board, board[0, :, 0].copy()
+
+class DummyPolicy:
+    '''
+    CPU policy of two random dense layers, to benchmark the broker without a model
+    planes: number of board planes, 1 + 2 * mode for view()
+    hidden: width of the hidden layer
+    '''
+    def __init__(self, planes, hidden=256, seed=0):
+        rng = np.random.default_rng(seed)
+        self.w1 = rng.standard_normal((planes * 34 * 5, hidden), dtype=np.float32) * 0.05
+        self.w2 = rng.standard_normal((hidden, 34), dtype=np.float32) * 0.05
+
+    def __call__(self, boards, legal):
+        hidden = np.maximum(boards.reshape(len(boards), -1).astype(np.float32) @ self.w1, 0)
+        logits = hidden @ self.w2
+        logits[~legal] = -np.inf
+        return logits.argmax(axis=1)
+
+class InferenceBroker:
+    '''
+    Collects decision requests into batches for one policy call
+    policy: function of boards and legal masks, see module docstring
+    max_batch: most requests in one batch
+    max_latency: seconds a request waits for the batch to fill
+    stats: number of batches, requests and flushes by reason
+    '''
+    def __init__(self, policy, max_batch=64, max_latency=0.002):
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.clients = 0
+        self.stats = Counter()
+        self.queue = None
+        self.worker = None
+
+    def connect(self):
+        '''
+        Registers a table, a batch is flushed as soon as every registered table is waiting
+        '''
+        self.clients += 1
+
+    def disconnect(self):
+        self.clients -= 1
+        if self.queue is not None:
+            # Wake the worker so it sees the table is gone
+            self.queue.put_nowait(None)
+
+    async def decide(self, board, legal):
+        '''
+        Returns the policy's action for one board once its batch has run
+        '''
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self._serve())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((board, legal, future))
+        return await future
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def _full(self, batch):
+        return len(batch) >= self.max_batch or (self.clients > 0 and len(batch) >= self.clients)
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self.queue.get()
+            if first is None:
+                continue
+            batch = [first]
+            deadline = loop.time() + self.max_latency
+            reason = 'latency'
+            while True:
+                if self._full(batch):
+                    reason = 'size' if len(batch) >= self.max_batch else 'clients'
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if request is not None:
+                    batch.append(request)
+            self._run(batch)
+            self.stats['batches'] += 1
+            self.stats['requests'] += len(batch)
+            self.stats[f'flush {reason}'] += 1
+
+    def _run(self, batch):
+        '''
+        Calls the policy once for a batch and routes each action back to its request
+        '''
+        try:
+            actions = self.policy(np.stack([board for board, _, _ in batch]),
+                                  np.stack([legal for _, legal, _ in batch]))
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, _, future), action in zip(batch, actions):
+            if not future.done():
+                future.set_result(int(action))
+
+async def play_table(broker, mode, rng):
+    '''
+    Plays one game with every discard decided through the broker
+    Returns the round results and final standing, see game_runner.game_steps()
+    '''
+    broker.connect()
+    try:
+        steps = game_steps(mode, rng)
+        round, seat = next(steps)
+        while True:
+            round, seat = steps.send(await broker.decide(*view(round, seat)))
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        broker.disconnect()
+
+async def run(tables, mode=4, max_batch=64, max_latency=0.002, seed=None, policy=None):
+    '''
+    Plays one game on each of tables concurrent tables through one broker
+    policy: defaults to DummyPolicy
+    Returns dict with decisions, seconds, decisions per second and the broker stats
+    '''
+    policy = DummyPolicy(1 + 2 * mode) if policy is None else policy
+    broker = InferenceBroker(policy, max_batch, max_latency)
+    seeds = np.random.SeedSequence(seed).spawn(tables)
+    start = time.perf_counter()
+    await asyncio.gather(*[play_table(broker, mode, np.random.default_rng(s)) for s in seeds])
+    seconds = time.perf_counter() - start
+    await broker.close()
+    stats = dict(broker.stats)
+    stats.update({'seconds': seconds, 'decisions/sec': stats.get('requests', 0) / seconds,
+                  'mean batch': stats.get('requests', 0) / max(stats.get('batches', 0), 1)})
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched inference over many tables')
+    parser.add_argument('--tables', type=int, default=64)
+    parser.add_argument('--mode', type=int, default=4, choices=(3, 4))
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-latency', type=float, default=0.002)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', action='store_true', help='also run unbatched, max batch 1')
+    args = parser.parse_args()
+
+    settings = [args.max_batch, 1] if args.compare else [args.max_batch]
+    for max_batch in settings:
+        stats = asyncio.run(run(args.tables, args.mode, max_batch, args.max_latency, args.seed))
+        print(f'max batch {max_batch}:')
+        for key, value in stats.items():
+            print(f'  {key}: {value:.2f}' if isinstance(value, float) else f'  {key}: {value}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+from pathlib import Path
+import numpy as np
+
+# Modules live in the repository root, one level above this script
+sys.path.append(str(Path(__file__, '..', '..').resolve()))
+from Tile import Tile, counts_to_index
+from game_runner import BOTS
+'''
+Stub client for game_server.py, plays with one of the bots of game_runner over a connection
+Run as a script: python utilities/stub_client.py --clients 8 --bot shanten --port 8765
+With --delay, every answer is held back that many seconds, to test turn timeouts
+'''
+
+async def play(name, bot, host='127.0.0.1', port=8765, path=None, delay=0.0):
+    '''
+    Joins the server, plays one game and returns the end message
+    '''
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    send = lambda message: writer.write((json.dumps(message) + '\n').encode())
+    send({'type': 'join', 'name': name})
+    end = None
+    try:
+        while end is None:
+            line = await reader.readline()
+            if len(line) == 0:
+                break
+            message = json.loads(line)
+            if message['type'] == 'observe':
+                hand = counts_to_index(np.array(message['hand']), message['reds'])
+                round = SimpleNamespace(last_draw=Tile.of(message['draw']))
+                tile = bot.discard(hand, round, message['seat'])
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                send({'type': 'action', 'turn': message['turn'], 'tile': int(tile)})
+                await writer.drain()
+            elif message['type'] == 'end':
+                end = message
+    finally:
+        writer.close()
+    return end
+
+async def _run(args):
+    seeds = np.random.SeedSequence(args.seed).spawn(args.clients)
+    clients = [play(f'{args.bot} {i}', BOTS[args.bot](np.random.default_rng(seed)),
+                    args.host, args.port, args.unix, args.delay)
+               for i, seed in enumerate(seeds)]
+    return await asyncio.gather(*clients)
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub bot clients for game_server.py')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--bot', type=str, default='shanten', choices=list(BOTS))
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', type=str, default=None, help='Unix socket path instead of TCP')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ends = asyncio.run(_run(args))
+    tables = {end['table']: end for end in ends if end is not None}
+    for table, end in sorted(tables.items()):
+        print(f'table {table}: {end["rounds"]} rounds, standing {end["standing"]}')
+    print(f'{len(tables)} games in {time.perf_counter() - start:.2f} seconds')
+
+if __name__ == "__main__":
+    main()